@@ -0,0 +1,77 @@
+# Password alphabet and integer coding shared by all scripts
+#
+# Characters are coded by their position in ALPHABET, and a (k-1)-gram is coded
+# as the base-ALPHABET_SIZE number formed by its character codes. Numeric order
+# of gram codes is therefore the order of itertools.product(ALPHABET, ...), i.e.
+# the order in which wildcards get expanded during enumeration.
+#
+# Sets of codes are kept as bitsets: a plain int for sets of characters, and a
+# bytearray for sets of (k-1)-grams (whose code space grows as 95^(k-1)).
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import string                           # Use string constants
+
+# Valid chars in password (all 95 printable ASCII chars)
+ALPHABET = string.digits + string.ascii_letters + "~`!@#$%^&*()_-+={[}]|\:;\"'<,>.?/ "
+ALPHABET_SIZE = len(ALPHABET)
+
+# Char -> char code
+CHAR_CODE = {c: i for i, c in enumerate(ALPHABET)}
+
+
+def is_supported(pw):
+    """
+    Whether every char of the password is in ALPHABET.
+    """
+    return all(c in CHAR_CODE for c in pw)
+
+
+def encode(pw):
+    """
+    Map a password to its list of char codes.
+    """
+    return [CHAR_CODE[c] for c in pw]
+
+
+def decode(codes):
+    """
+    Map a list of char codes back to the password.
+    """
+    return "".join(ALPHABET[c] for c in codes)
+
+
+def gram_code(codes):
+    """
+    Code of the gram made of the given char codes.
+    """
+    code = 0
+    for c in codes:
+        code = code * ALPHABET_SIZE + c
+    return code
+
+
+def gram_chars(code, n):
+    """
+    Char codes of the n-gram with the given code.
+    """
+    codes = [0] * n
+    for i in xrange(n - 1, -1, -1):
+        code, codes[i] = divmod(code, ALPHABET_SIZE)
+    return codes
+
+
+def new_bitset(size):
+    """
+    Empty bitset able to hold codes in [0, size).
+    """
+    return bytearray((size + 7) >> 3)
+
+
+def bitset_add(bits, code):
+    bits[code >> 3] |= 1 << (code & 7)
+
+
+def bitset_has(bits, code):
+    return (bits[code >> 3] >> (code & 7)) & 1
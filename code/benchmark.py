@@ -0,0 +1,272 @@
+# Reproducible benchmark of training, checkpointing and guessing
+#
+# Input: Nothing but the options below; a synthetic password corpus is generated
+#        from a fixed seed.
+#
+# Output: Timings of every stage as JSON, written to ../data/bench/results.json:
+#   - statgen-additive.py and discretization.py runs;
+#   - checkpoint.py run of each (length, level) bucket in the grid;
+#   - guess.py model load, and per-query latency percentiles of guess_number()
+#     over a fixed set of passwords, along with their guess numbers.
+#   With --baseline, results are compared against a previous run, and the exit
+#   status is 1 if any stage got slower than the tolerance allows or any guess
+#   number changed.
+#
+# Each stage and each query runs --repeat times and counts for its fastest run:
+# background load only ever adds time, so the minimum is the timing least affected
+# by it, and a single slow run does not fail the comparison. Latency percentiles
+# are taken over the fastest run of every query.
+#
+# The pipeline runs in its own work directory (../data/bench/work/ by default),
+# laid out like the repo, so existing data is left alone.
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import argparse                         # For command line options
+import json                             # For JSON I/O
+import os                               # For path expansion
+import platform                         # For interpreter info
+import random                           # For the synthetic corpus
+import subprocess                       # For running the scripts
+import sys                              # For argv and exit
+import time                             # For timing
+
+# Current directory of script
+CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
+# Directory of the scripts being benchmarked
+CODE_DIR = os.path.dirname(os.path.realpath(__file__))
+# Output directory for results and work files
+BENCH_PREFIX = os.path.join(CURRENT_DIR, "../data/bench/")
+
+# Words the synthetic corpus is built from
+BASE_WORDS = ("password", "monkey", "dragon", "letmein", "qwerty", "abc123", "iloveyou",
+              "sunshine", "master", "shadow", "princess", "football", "baseball",
+              "welcome", "superman", "trustno1", "michael", "jennifer", "hunter",
+              "freedom", "whatever", "starwars", "computer", "summer", "pepper",
+              "love", "pass", "qwer", "asdf", "zxcv", "1234", "abc", "god", "cat", "dog")
+SYMBOLS = "!@#$%&*?._-"
+LEET = {"a": "@", "e": "3", "i": "1", "o": "0", "s": "$"}
+
+# Stages compared against the baseline, and smallest slowdown (secs) that counts
+STAGE_METRICS = ("statgen", "discretization", "checkpoint", "load")
+GUESS_METRICS = ("p50", "p90", "p99")
+MIN_DELTA = 0.001
+
+
+def generate_corpus(fname, size, seed):
+    """
+    Write a synthetic corpus of size distinct passwords with Zipf-like counts,
+    in the input format of statgen-additive.py.
+    """
+    rng = random.Random(seed)
+    counts = {}
+    while len(counts) < size:
+        word = rng.choice(BASE_WORDS)
+        if rng.random() < 0.2:
+            word = word.capitalize()
+        if rng.random() < 0.1:
+            word = "".join(LEET.get(c, c) for c in word)
+        if rng.random() < 0.5:
+            word += str(rng.randint(0, 999))
+        if rng.random() < 0.15:
+            word += rng.choice(SYMBOLS)
+        counts[word] = counts.get(word, 0) + int(1000 / (1 + len(counts)) ** 0.8) + 1
+
+    delimiter = 10
+    with open(fname, 'w') as f:
+        f.write("{}\n".format(delimiter))
+        for word in sorted(counts):
+            f.write("{:<{}}{}\n".format(counts[word], delimiter, word))
+    return sorted(counts)
+
+
+def run_script(python, work_dir, script, *args):
+    """
+    Run one of the scripts from the work directory.
+    """
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call([python, os.path.join(CODE_DIR, script)] + [str(a) for a in args],
+                              cwd=work_dir, stdout=devnull)
+
+
+def best_of(repeat, fn, *args):
+    """
+    Call fn(*args) repeat times, and return the wall time of the fastest call
+    along with the result of the first one.
+    """
+    best = None
+    first = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = fn(*args)
+        elapsed = time.time() - start
+        if i == 0:
+            best, first = elapsed, result
+        else:
+            best = min(best, elapsed)
+    return best, first
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, int(round(p / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_benchmark(opts):
+    base_dir = os.path.abspath(opts.work_dir)
+    work_dir = os.path.join(base_dir, "code")
+    data_dir = os.path.join(base_dir, "data")
+    checkpoint_dir = os.path.join(data_dir, "checkpoints", "{}_{}".format(opts.k, opts.smoothing))
+    for d in (work_dir, os.path.join(data_dir, "input"), os.path.join(data_dir, "probs"),
+              os.path.join(data_dir, "levels"), checkpoint_dir):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    grid = dict((ln, xrange(opts.max_level + 1)) for ln in opts.lengths)
+
+    results = {"config": {"corpus_size": opts.corpus_size,
+                          "seed": opts.seed,
+                          "k": opts.k,
+                          "smoothing": opts.smoothing,
+                          "lengths": opts.lengths,
+                          "max_level": opts.max_level,
+                          "queries": opts.queries,
+                          },
+               "python": {"executable": opts.python,
+                          "harness": platform.python_implementation() + " " + platform.python_version(),
+                          },
+               "repeat": opts.repeat,
+               "stages": {},
+               }
+
+    print("Generating corpus of {} passwords...".format(opts.corpus_size))
+    corpus = generate_corpus(os.path.join(data_dir, "input", "dataset-ascii.csv"),
+                             opts.corpus_size, opts.seed)
+
+    print("Running statgen-additive.py...")
+    results["stages"]["statgen"], _ = best_of(opts.repeat, run_script, opts.python, work_dir,
+                                              "statgen-additive.py")
+    print("Running discretization.py...")
+    results["stages"]["discretization"], _ = best_of(opts.repeat, run_script, opts.python, work_dir,
+                                                     "discretization.py")
+
+    buckets = {}
+    for ln in sorted(grid):
+        for lvl in grid[ln]:
+            print("Running checkpoint.py for length {} and level {}...".format(ln, lvl))
+            buckets["{}_{}".format(ln, lvl)], _ = best_of(opts.repeat, run_script, opts.python,
+                                                          work_dir, "checkpoint.py",
+                                                          opts.k, opts.smoothing, ln, lvl)
+    results["stages"]["checkpoint"] = sum(buckets.values())
+    results["checkpoint_buckets"] = buckets
+
+    # Guessing runs in-process, so that we time queries rather than startup
+    os.chdir(work_dir)
+    sys.path.insert(0, CODE_DIR)
+    import guess
+    guess.AVAILABLE_CP = grid
+    guess.CHECKPOINT_PREFIX = checkpoint_dir + "/"      # Where checkpoint.py wrote them
+    results["stages"]["load"], _ = best_of(opts.repeat, guess.load_levels, opts.k, opts.smoothing)
+
+    # Fixed query set: corpus passwords cut to each length, that fall into the grid
+    candidates = set()
+    for pw in corpus:
+        for ln in grid:
+            if len(pw) < ln:
+                continue
+            components = guess.decompose_password(pw[:ln], opts.k)
+            if sum(l for l, _, _ in components) in grid[ln]:
+                candidates.add(pw[:ln])
+    candidates = sorted(candidates)
+    queries = random.Random(opts.seed).sample(candidates, min(opts.queries, len(candidates)))
+
+    print("Guessing {} passwords...".format(len(queries)))
+    latencies = []
+    guess_numbers = {}
+    for pw in queries:
+        latency, guess_numbers[pw] = best_of(opts.repeat, guess.guess_number, pw)
+        latencies.append(latency)
+    latencies.sort()
+    results["guess"] = {"queries": len(latencies),
+                        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                        "p50": percentile(latencies, 50),
+                        "p90": percentile(latencies, 90),
+                        "p99": percentile(latencies, 99),
+                        "max": latencies[-1] if latencies else 0.0,
+                        }
+    results["guess_numbers"] = guess_numbers
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print how results compare to the baseline, and return the list of problems.
+    """
+    problems = []
+    if results["config"] != baseline["config"]:
+        problems.append("config differs from baseline: {}".format(baseline["config"]))
+        return problems
+
+    rows = [("stages." + m, results["stages"][m], baseline["stages"][m]) for m in STAGE_METRICS]
+    rows += [("guess." + m, results["guess"][m], baseline["guess"][m]) for m in GUESS_METRICS]
+    print("{:<24}{:>12}{:>12}{:>9}".format("metric", "baseline", "current", "ratio"))
+    for name, current, base in rows:
+        ratio = current / base if base else 1.0
+        print("{:<24}{:>12.4f}{:>12.4f}{:>9.2f}".format(name, base, current, ratio))
+        if current > base * (1 + tolerance) and current - base > MIN_DELTA:
+            problems.append("{} regressed: {:.4f}s -> {:.4f}s".format(name, base, current))
+
+    for pw, expected in sorted(baseline["guess_numbers"].iteritems()):
+        if results["guess_numbers"].get(pw) != expected:
+            problems.append("guess number of {!r} changed: {} -> {}".format(
+                pw, expected, results["guess_numbers"].get(pw)))
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark training, checkpointing and guessing.")
+    parser.add_argument("--corpus-size", type=int, default=5000, help="distinct passwords in corpus")
+    parser.add_argument("--seed", type=int, default=731, help="seed for corpus and queries")
+    parser.add_argument("--k", type=int, default=3, help="k-gram model to checkpoint and guess")
+    parser.add_argument("--smoothing", default="additive", help="smoothing of the model")
+    parser.add_argument("--lengths", type=lambda s: [int(x) for x in s.split(",")], default=[4, 5],
+                        help="comma-separated password lengths to checkpoint")
+    parser.add_argument("--max-level", type=int, default=12, help="highest level to checkpoint")
+    parser.add_argument("--queries", type=int, default=200, help="passwords to guess")
+    parser.add_argument("--python", default=sys.executable, help="interpreter for the scripts")
+    parser.add_argument("--work-dir", default=os.path.join(BENCH_PREFIX, "work"),
+                        help="directory for corpus, levels and checkpoints")
+    parser.add_argument("--output", default=os.path.join(BENCH_PREFIX, "results.json"),
+                        help="file to write results to")
+    parser.add_argument("--baseline", help="results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown over baseline, as a fraction")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each stage and query, of which the fastest counts")
+    opts = parser.parse_args()
+    if opts.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    opts.output = os.path.abspath(opts.output)
+    baseline_file = os.path.abspath(opts.baseline) if opts.baseline else None
+
+    results = run_benchmark(opts)
+    if not os.path.isdir(os.path.dirname(opts.output)):
+        os.makedirs(os.path.dirname(opts.output))
+    with open(opts.output, 'w') as f:
+        json.dump(results, f, sort_keys=True, indent=4)
+    print("Results written to {}".format(opts.output))
+
+    if baseline_file:
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, opts.tolerance)
+        for problem in problems:
+            print("REGRESSION: " + problem)
+        if problems:
+            sys.exit(1)
+        print("No regressions against {}".format(baseline_file))
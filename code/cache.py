@@ -0,0 +1,145 @@
+# Bounded caches for the guess number calculator
+#
+# The scoring path in guess.py may keep, per loaded model:
+#   - guesses:     password -> guess number (None if beyond index space)
+#   - checkpoints: (len, level) -> checkpoint passwords of that bucket, bounded by
+#                  their total number of lines rather than of buckets
+#   - windows:     (len, level, idx) -> {password: guess count within bucket}
+#                  for every password between checkpoints idx - 1 and idx
+#   - window_queries: (len, level, idx) of windows queried once so far
+#   - totals:      (len, level) -> number of passwords in that bucket
+# All but totals are LRUs of bounded size; totals holds one int per bucket.
+#
+# Filling a window enumerates all of it, while a single query stops at its
+# password, so a window is only filled on its second query; one-off queries cost
+# the same as without caching.
+#
+# Every cache is tied to the version of the model it was filled from (level and
+# checkpoint files), and is dropped as a whole once a different version is loaded.
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+from collections import OrderedDict     # For LRU order
+
+# Default capacity of each cache, with the memory it takes once full, as measured
+# with CPython 2.7 for passwords of 8 chars
+GUESS_CAPACITY = 100000         # Passwords: ~32 MB
+CHECKPOINT_CAPACITY = 1 << 19   # Checkpoint lines, over all buckets: ~42 MB
+WINDOW_CAPACITY = 32            # Windows of up to 10000 passwords: ~34 MB
+# Windows queried once that are remembered, per window kept
+WINDOW_QUERY_FACTOR = 8
+
+# Memory per cached item, in bytes, from the measurements above
+GUESS_BYTES = 320               # Also taken for other LRU entries
+LINE_BYTES = 85
+WINDOW_PASSWORD_BYTES = 105
+
+# Default for lookups, as None is a valid cached value
+MISSING = object()
+
+
+class LRUCache(object):
+    """
+    Mapping of bounded size that evicts the least recently used entries. Each entry
+    counts for weigh(value) towards the capacity, or 1 if no weigh is given; a value
+    heavier than the whole capacity is not kept.
+    """
+
+    def __init__(self, capacity, weigh=None):
+        self.capacity = capacity
+        self.weigh = weigh
+        self.entries = OrderedDict()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries[key] = value   # Move to most recently used end
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        weight = self.weigh(value) if self.weigh is not None else 1
+        if key in self.entries:
+            self.discard(key)
+        if weight > self.capacity:
+            return
+        while self.weight + weight > self.capacity:
+            _, old = self.entries.popitem(last=False)
+            self.weight -= self.weigh(old) if self.weigh is not None else 1
+        self.entries[key] = value
+        self.weight += weight
+
+    def discard(self, key):
+        value = self.entries.pop(key)
+        self.weight -= self.weigh(value) if self.weigh is not None else 1
+
+    def clear(self):
+        self.entries.clear()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries),
+                "weight": self.weight,
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits * 1.0 / lookups if lookups else 0.0,
+                }
+
+
+class GuessCache(object):
+    """
+    All caches of the scoring path for one model version.
+    """
+
+    def __init__(self, version, guesses=GUESS_CAPACITY, checkpoints=CHECKPOINT_CAPACITY,
+                 windows=WINDOW_CAPACITY):
+        self.version = version
+        self.guesses = LRUCache(guesses)
+        self.checkpoints = LRUCache(checkpoints, len)
+        self.windows = LRUCache(windows)
+        self.window_queries = LRUCache(WINDOW_QUERY_FACTOR * windows)
+        self.totals = {}
+
+    def validate(self, version):
+        """
+        Drop everything if the caches were filled from another model version.
+        """
+        if version != self.version:
+            self.guesses.clear()
+            self.checkpoints.clear()
+            self.windows.clear()
+            self.window_queries.clear()
+            self.totals.clear()
+            self.version = version
+
+    def memory(self):
+        """
+        Estimated memory held by the caches, in bytes.
+        """
+        window_passwords = sum(len(window) for window in self.windows.entries.itervalues())
+        return (GUESS_BYTES * (len(self.guesses) + len(self.window_queries) + len(self.totals))
+                + LINE_BYTES * self.checkpoints.weight
+                + WINDOW_PASSWORD_BYTES * window_passwords)
+
+    def stats(self):
+        return {"version": self.version,
+                "guesses": self.guesses.stats(),
+                "checkpoints": self.checkpoints.stats(),
+                "windows": self.windows.stats(),
+                "window_queries": self.window_queries.stats(),
+                "totals": len(self.totals),
+                }
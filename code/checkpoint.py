@@ -9,13 +9,13 @@
 # For 08-731 F15
 # Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
 
-import json                             # For JSON I/O
 import os                               # For path expansion
 import sys                              # For argv and exit
 import math                             # For log, round
-from collections import defaultdict     # Easier index mgmt
-import string                           # Use string constants
-import itertools                        # Fancy list functions
+
+from alphabet import ALPHABET, ALPHABET_SIZE, decode, gram_chars
+from level_index import LevelIndex, WILDCARD, model_params
+import profiling                        # Counters and phase timers
 
 # Current directory of script
 CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
@@ -24,10 +24,6 @@ INPUT_PREFIX = os.path.join(CURRENT_DIR, "../data/levels/")
 # Output directory for checkpoint file
 CHECKPOINT_PREFIX = os.path.join(CURRENT_DIR, "../data/checkpoints/")
 
-# Valid chars in password
-ALPHABET = string.digits + string.ascii_letters
-ALPHABET_SIZE = len(ALPHABET)
-
 # Maximal level
 MAX_LEVEL = 10
 
@@ -37,7 +33,8 @@ UPDATE_FREQUENCY = 10000
 # Guess count so far
 GUESS_COUNT = 0
 
-# Scaling factors for probability (curated for k=3 with smoothing)
+# Scaling factors for probability (curated for k=3 with smoothing), used unless the
+# model comes with its own from discretization.py
 c1 = 1.11439835558
 c2 = 4.53959983946e-05
 # Default lvl for next char
@@ -46,6 +43,12 @@ NEXT_CHR_LVL = -int(round(math.log(c1 / ALPHABET_SIZE + c2)))
 # List of passwords to be included in the checkpoint
 CHECKPOINT = []
 
+# Every char code, for prefixes that are not in the index
+ALL_CHARS = range(ALPHABET_SIZE)
+
+# Counters and phase timers, off (None) unless enabled, see profiling.py
+profile = profiling.from_environment()
+
 
 def enumerate_passwords(k, smoothing, l, total_level, freq):
     if l < k - 1:
@@ -54,122 +57,146 @@ def enumerate_passwords(k, smoothing, l, total_level, freq):
 
     ##################
     # Load input files
-    file_name = INPUT_PREFIX + "{}_{}_start.json".format(k, smoothing)
-    with open(file_name, 'r') as f:
-        global start_lvl
-        start_lvl = json.load(f)
-    start_lvl = {int(key): val for key, val in start_lvl.iteritems()}
-    global start_tokens
-    start_tokens = set(itertools.chain.from_iterable(
-        start_lvl.values()))   # Record all starting (k-1)-grams
-
-    file_name = INPUT_PREFIX + "{}_{}_end.json".format(k, smoothing)
-    with open(file_name, 'r') as f:
-        global end_lvl
-        end_lvl = json.load(f)
-    end_lvl = {int(key): val for key, val in end_lvl.iteritems()}
-    global end_tokens
-    end_tokens = set(itertools.chain.from_iterable(end_lvl.values())
-                     )       # Record all ending (k-1)-grams
-
-    file_name = INPUT_PREFIX + "{}_{}_mid.json".format(k, smoothing)
-    with open(file_name, 'r') as f:
-        global mid_lvl
-        mid_lvl = json.load(f)
-    for prefix in mid_lvl:
-        mid_lvl[prefix] = {int(key): val for key, val in mid_lvl[prefix].iteritems()}
-    global mid_tokens
-    mid_tokens = {key: set(itertools.chain.from_iterable(val.values()))
-                  for key, val in mid_lvl.iteritems()}  # Record chars after (k-1)-gram
+    global levels
+    with profiling.phase(profile, "load"):
+        levels = LevelIndex(INPUT_PREFIX, k, smoothing, NEXT_CHR_LVL)
 
     ##################
     # Let's enumerate!
-    dfs_passwords(l,            # total length,
-                  k,            # k-gram model
-                  0,            # next char index to enumerate
-                  "",           # password so far
-                  total_level,  # total level remaining
-                  )
-
-
-def dfs_passwords(l, k, next_idx, passwd, remaining_lvl):
+    with profiling.phase(profile, "enumerate"):
+        dfs_passwords(l,            # total length,
+                      k,            # k-gram model
+                      0,            # next char index to enumerate
+                      [],           # password so far, as char codes
+                      0,            # code of the last (k-1) chars
+                      total_level,  # total level remaining
+                      )
+
+
+def count_last_chars(passwd, chars):
+    """
+    Count the passwords made of passwd followed by each of chars in one step,
+    only materializing those that land on a checkpoint.
+    """
+    global GUESS_COUNT
+    # 1-based position in chars of the next password to checkpoint
+    pos = UPDATE_FREQUENCY - GUESS_COUNT % UPDATE_FREQUENCY
+    if pos <= len(chars):
+        head = decode(passwd)
+        while pos <= len(chars):
+            CHECKPOINT.append(head + ALPHABET[chars[pos - 1]])
+            pos += UPDATE_FREQUENCY
+    GUESS_COUNT += len(chars)
+    if profile is not None:
+        profile.leaves += len(chars)
+
+
+def dfs_passwords(l, k, next_idx, passwd, prefix, remaining_lvl):
     global GUESS_COUNT
     global CHECKPOINT
+    if profile is not None:
+        profile.nodes += 1
 
     # Finishing case
     if next_idx == l:   # End of password
         if remaining_lvl == 0:
             GUESS_COUNT += 1
+            if profile is not None:
+                profile.leaves += 1
             if GUESS_COUNT % UPDATE_FREQUENCY == 0:
-                CHECKPOINT.append(passwd)
+                CHECKPOINT.append(decode(passwd))
+        elif profile is not None:
+            profile.pruned += 1
         return
-    # Trim impossible cases
-    elif MAX_LEVEL * (l - next_idx) < remaining_lvl:
+    # Trim impossible cases (levels are never negative)
+    elif MAX_LEVEL * (l - next_idx) < remaining_lvl or remaining_lvl < 0:
+        if profile is not None:
+            profile.pruned += 1
         return
     # Last character
     elif next_idx == l - 1:
-        suffix = passwd[-(k - 1):]
-        if suffix not in mid_lvl:
+        if prefix not in levels.mid_lvl:
             if remaining_lvl != NEXT_CHR_LVL:
+                if profile is not None:
+                    profile.pruned += 1
                 return
-            for c in ALPHABET:
-                GUESS_COUNT += 1
-                if GUESS_COUNT % UPDATE_FREQUENCY == 0:
-                    CHECKPOINT.append(passwd + c)
+            if profile is not None:
+                profile.wildcards += ALPHABET_SIZE
+            count_last_chars(passwd, ALL_CHARS)
             return
-        elif remaining_lvl not in mid_lvl[suffix]:
+        elif remaining_lvl not in levels.mid_lvl[prefix]:
+            if profile is not None:
+                profile.pruned += 1
             return  # Ehh, bad case
-        for next_chr in mid_lvl[suffix][remaining_lvl]:
-            if next_chr != "":
-                GUESS_COUNT += 1
-                if GUESS_COUNT % UPDATE_FREQUENCY == 0:
-                    CHECKPOINT.append(passwd + next_chr)
+        for next_chr in levels.mid_lvl[prefix][remaining_lvl]:
+            if next_chr != WILDCARD:
+                count_last_chars(passwd, (next_chr,))
             else:
-                for c in ALPHABET:
-                    if c in mid_tokens[suffix]:
-                        continue
-                    GUESS_COUNT += 1
-                    if GUESS_COUNT % UPDATE_FREQUENCY == 0:
-                        CHECKPOINT.append(passwd + c)
+                if profile is not None:
+                    profile.wildcards += len(levels.mid_wildcards(prefix))
+                count_last_chars(passwd, levels.mid_wildcards(prefix))
     # Initial case
     elif next_idx == 0:
         for init_level in xrange(0, min(remaining_lvl, MAX_LEVEL) + 1):
-            if init_level not in start_lvl:
+            if init_level not in levels.start_lvl:
                 continue
-            for init_sequence in start_lvl[init_level]:
-                if init_sequence != "":
+            for init_sequence in levels.start_lvl[init_level]:
+                if init_sequence != WILDCARD:
                     # Normal case
-                    dfs_passwords(l, k, k - 1, init_sequence, remaining_lvl - init_level)
+                    dfs_passwords(l, k, k - 1, gram_chars(init_sequence, k - 1), init_sequence,
+                                  remaining_lvl - init_level)
                 else:
                     # Wildcard case...
-                    for init_seq in ("".join(k) for k in itertools.product(ALPHABET, repeat=k - 1)):
-                        if init_seq in start_tokens:
-                            continue
-                        dfs_passwords(l, k, k - 1, init_seq, remaining_lvl - init_level)
+                    for init_seq in levels.start_wildcards():
+                        if profile is not None:
+                            profile.wildcards += 1
+                        dfs_passwords(l, k, k - 1, gram_chars(init_seq, k - 1), init_seq,
+                                      remaining_lvl - init_level)
     # Intermediate case
     else:
-        prefix = passwd[-(k - 1):]
-        if prefix not in mid_lvl:
+        # Code of the next prefix is shifted + next char
+        shifted = (prefix % levels.shift_mod) * ALPHABET_SIZE
+        if prefix not in levels.mid_lvl:
             # Special case when we apply uniform probability to everything
-            for c in ALPHABET:
-                dfs_passwords(l, k, next_idx + 1, passwd + c, remaining_lvl - NEXT_CHR_LVL)
+            if remaining_lvl < NEXT_CHR_LVL:
+                if profile is not None:
+                    profile.pruned += 1
+                return
+            if profile is not None:
+                profile.wildcards += ALPHABET_SIZE
+            for c in ALL_CHARS:
+                passwd.append(c)
+                dfs_passwords(l, k, next_idx + 1, passwd, shifted + c, remaining_lvl - NEXT_CHR_LVL)
+                passwd.pop()
             return
         # Regular case
         for next_level in xrange(0, min(remaining_lvl, MAX_LEVEL) + 1):
-            if next_level not in mid_lvl[prefix]:
+            if next_level not in levels.mid_lvl[prefix]:
                 continue
-            for next_chr in mid_lvl[prefix][next_level]:
+            for next_chr in levels.mid_lvl[prefix][next_level]:
                 # Wildcard case...
-                if next_chr == "":
-                    for c in ALPHABET:
-                        if c in mid_tokens[prefix]:
-                            continue
-                        dfs_passwords(l, k, next_idx + 1, passwd + c, remaining_lvl - next_level)
+                if next_chr == WILDCARD:
+                    if profile is not None:
+                        profile.wildcards += len(levels.mid_wildcards(prefix))
+                    for c in levels.mid_wildcards(prefix):
+                        passwd.append(c)
+                        dfs_passwords(l, k, next_idx + 1, passwd, shifted + c,
+                                      remaining_lvl - next_level)
+                        passwd.pop()
                 # Normal case
                 else:
-                    dfs_passwords(l, k, next_idx + 1, passwd + next_chr, remaining_lvl - next_level)
+                    passwd.append(next_chr)
+                    dfs_passwords(l, k, next_idx + 1, passwd, shifted + next_chr,
+                                  remaining_lvl - next_level)
+                    passwd.pop()
 
 if __name__ == "__main__":
+    # Report counters and phase timers of the run to stderr
+    if "--profile" in sys.argv[1:]:
+        sys.argv.remove("--profile")
+        profile = profiling.Profile("-")
+    profiling.start_cprofile()
+
     # Input handling
     try:
         K = int(sys.argv[1])
@@ -178,9 +205,12 @@ if __name__ == "__main__":
         LEN = int(sys.argv[3])
         TOTAL_LEVEL = int(sys.argv[4])
     except Exception:
-        print("usage: checkpoint.py K smoothing_mode length total_level\n")
+        print("usage: checkpoint.py [--profile] K smoothing_mode length total_level\n")
         sys.exit(1)
 
+    # Parameters of the model, if recorded by discretization.py
+    c1, c2, NEXT_CHR_LVL, MAX_LEVEL = model_params(INPUT_PREFIX, K, SMOOTHING, c1, c2, MAX_LEVEL)
+
     OUTPUT_FILE = os.path.join(CURRENT_DIR,
                                "../data/checkpoints/{}_{}/{}_{}.out".format(
                                    K, SMOOTHING, LEN, TOTAL_LEVEL)
@@ -192,10 +222,14 @@ if __name__ == "__main__":
     enumerate_passwords(K, SMOOTHING, LEN, TOTAL_LEVEL, UPDATE_FREQUENCY)
 
     # Write output to checkpoint file
-    with open(OUTPUT_FILE, 'w') as f:
-        for passwd in CHECKPOINT:
-            f.write("{}\n".format(passwd))
-        f.write("\n")
-        f.write(str(GUESS_COUNT) + "\n")
+    with profiling.phase(profile, "write"):
+        with open(OUTPUT_FILE, 'w') as f:
+            for passwd in CHECKPOINT:
+                f.write("{}\n".format(passwd))
+            f.write("\n")
+            f.write(str(GUESS_COUNT) + "\n")
 
     print("Checkpointing finished! Total passwords: {}.".format(GUESS_COUNT))
+    if profile is not None:
+        profile.report(event="checkpoint", k=K, smoothing=SMOOTHING, length=LEN, level=TOTAL_LEVEL,
+                       passwords=GUESS_COUNT)
@@ -0,0 +1,361 @@
+# Corpus-wide (length, level) histograms and log-probabilities, vectorized with NumPy
+#
+# Input:
+#   - Level index in ../data/levels/*_*_*.json and probabilities in
+#     ../data/probs/*_*_*.json of the model in guess.py
+#   - Password corpus, by default ../data/input/dataset-ascii.csv in the format
+#     read by statgen-additive.py, or one password per line with --plain
+#
+# With --check, the total count read is checked against statgen-additive.py's.
+#
+# Output: ../data/analysis/${k}_${smoothing}_levels.json with, for every (length,
+#   level) bucket, the number of distinct passwords and their total count, and
+#   how much of the corpus falls into AVAILABLE_CP. With --scores, the length,
+#   level and model log-probability of every password are also written as TSV.
+#
+# Instead of calling decompose_password per password, the corpus is read as one
+# byte array, cut into per-length matrices of char codes, and every start /
+# transition level and probability is gathered from sorted lookup arrays for a
+# whole column of passwords at a time. The log-probability is that of the same
+# start + transition chain the levels are built from.
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import json                             # For JSON I/O
+import math                             # For log
+import os                               # For path expansion
+import sys                              # For argv and exit
+import time                             # For throughput
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import guess                            # Model parameters and level index
+from alphabet import ALPHABET, ALPHABET_SIZE, decode, gram_chars
+
+# Current directory of script
+CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
+# Input directory for probability files
+PROBS_PREFIX = os.path.join(CURRENT_DIR, "../data/probs/")
+# Input password file
+PASSWD_FILE = os.path.join(CURRENT_DIR, "../data/input/dataset-ascii.csv")
+# Output directory for histograms
+OUTPUT_PREFIX = os.path.join(CURRENT_DIR, "../data/analysis/")
+
+# Chars stripped around each password, as str.strip() does in statgen-additive.py
+WHITESPACE = " \t\n\r\x0b\x0c"
+# Char code of bytes outside ALPHABET
+INVALID = 255
+# Level of passwords the model gives zero probability (unsmoothed models only)
+NO_LEVEL = -1
+# Largest number of k-grams to keep dense lookup tables for
+DENSE_LIMIT = 1 << 24
+
+
+class ModelArrays(object):
+    """
+    Levels and log-probabilities of a model as NumPy lookup arrays.
+    """
+
+    def __init__(self, levels, probs_prefix):
+        k = levels.k
+        self.k = k
+        self.gram_space = levels.gram_space
+        self.next_chr_lvl = levels.next_chr_lvl
+        self.next_chr_logp = math.log(1.0 / ALPHABET_SIZE)
+
+        with open(probs_prefix + "{}_{}_start.json".format(k, levels.smoothing), 'r') as f:
+            start_p = json.load(f)
+        codes = sorted(levels.start_rank)
+        self.start_keys = np.array(codes, dtype=np.int64)
+        self.start_levels = np.array([levels.start_rank[c][0] for c in codes], dtype=np.int32)
+        self.start_logp = np.log([start_p[decode(gram_chars(c, k - 1))] for c in codes])
+        if levels.start_wild is not None:
+            self.start_wild = (levels.start_wild[0], math.log(start_p[""]))
+        else:
+            self.start_wild = (NO_LEVEL, float("-inf"))
+
+        with open(probs_prefix + "{}_{}_mid.json".format(k, levels.smoothing), 'r') as f:
+            mid_p = json.load(f)
+        keys, mid_levels, mid_logp = [], [], []
+        prefixes = sorted(levels.mid_rank)
+        wild_levels, wild_logp = [], []
+        for prefix in prefixes:
+            prefix_p = mid_p[decode(gram_chars(prefix, k - 1))]
+            rank = levels.mid_rank[prefix]
+            for c in sorted(rank):
+                keys.append(prefix * ALPHABET_SIZE + c)
+                mid_levels.append(rank[c][0])
+                mid_logp.append(math.log(prefix_p[ALPHABET[c]]))
+            if levels.mid_wild[prefix] is not None:
+                wild_levels.append(levels.mid_wild[prefix][0])
+                wild_logp.append(math.log(prefix_p[""]))
+            else:
+                wild_levels.append(NO_LEVEL)
+                wild_logp.append(float("-inf"))
+        self.mid_keys = np.array(keys, dtype=np.int64)
+        self.mid_levels = np.array(mid_levels, dtype=np.int32)
+        self.mid_logp = np.array(mid_logp, dtype=np.float64)
+        self.prefix_keys = np.array(prefixes, dtype=np.int64)
+        self.prefix_wild_levels = np.array(wild_levels, dtype=np.int32)
+        self.prefix_wild_logp = np.array(wild_logp, dtype=np.float64)
+
+        # Small key spaces get dense tables with wildcards and unseen prefixes already
+        # resolved, so that a lookup is a single gather
+        self.dense = ALPHABET_SIZE ** k <= DENSE_LIMIT
+        if self.dense:
+            size = ALPHABET_SIZE ** (k - 1)
+            self.start_level_table = np.full(size, self.start_wild[0], dtype=np.int32)
+            self.start_level_table[self.start_keys] = self.start_levels
+            self.start_logp_table = np.full(size, self.start_wild[1], dtype=np.float64)
+            self.start_logp_table[self.start_keys] = self.start_logp
+
+            size *= ALPHABET_SIZE
+            wild_keys = (self.prefix_keys[:, None] * ALPHABET_SIZE + np.arange(ALPHABET_SIZE)).ravel()
+            self.mid_level_table = np.full(size, self.next_chr_lvl, dtype=np.int32)
+            self.mid_level_table[wild_keys] = np.repeat(self.prefix_wild_levels, ALPHABET_SIZE)
+            self.mid_level_table[self.mid_keys] = self.mid_levels
+            self.mid_logp_table = np.full(size, self.next_chr_logp, dtype=np.float64)
+            self.mid_logp_table[wild_keys] = np.repeat(self.prefix_wild_logp, ALPHABET_SIZE)
+            self.mid_logp_table[self.mid_keys] = self.mid_logp
+
+    def start(self, prefix):
+        """
+        Levels and log-probabilities of an array of starting (k-1)-gram codes.
+        """
+        if self.dense:
+            return self.start_level_table[prefix], self.start_logp_table[prefix]
+        found, pos = lookup(self.start_keys, prefix)
+        return (np.where(found, self.start_levels[pos], self.start_wild[0]),
+                np.where(found, self.start_logp[pos], self.start_wild[1]))
+
+    def transition(self, prefix, c):
+        """
+        Levels and log-probabilities of arrays of (k-1)-gram codes followed by char codes.
+        """
+        key = prefix * ALPHABET_SIZE + c
+        if self.dense:
+            return self.mid_level_table[key], self.mid_logp_table[key]
+        found, pos = lookup(self.mid_keys, key)
+        listed, prefix_pos = lookup(self.prefix_keys, prefix)
+        # Unlisted char: wildcard of the prefix if listed, uniform otherwise
+        wild_level = np.where(listed, self.prefix_wild_levels[prefix_pos], self.next_chr_lvl)
+        wild_logp = np.where(listed, self.prefix_wild_logp[prefix_pos], self.next_chr_logp)
+        return (np.where(found, self.mid_levels[pos], wild_level),
+                np.where(found, self.mid_logp[pos], wild_logp))
+
+    def score(self, codes):
+        """
+        Given an (n, length) matrix of char codes, return the arrays of total levels
+        and log-probabilities of the n passwords. Passwords with zero probability
+        get level NO_LEVEL.
+        """
+        n, length = codes.shape
+        # One contiguous row per position, wide enough for k-gram codes
+        codes = np.ascontiguousarray(codes.T, dtype=np.int64)
+
+        prefix = np.zeros(n, dtype=np.int64)
+        for j in xrange(self.k - 1):
+            prefix = prefix * ALPHABET_SIZE + codes[j]
+        level, logp = self.start(prefix)
+        valid = level != NO_LEVEL
+
+        for i in xrange(self.k - 1, length):
+            c = codes[i]
+            step_level, step_logp = self.transition(prefix, c)
+            valid &= step_level != NO_LEVEL
+            level += step_level
+            logp += step_logp
+            prefix = (prefix * ALPHABET_SIZE + c) % self.gram_space
+
+        level[~valid] = NO_LEVEL
+        return level, logp
+
+
+def lookup(keys, query):
+    """
+    For each query value, whether it is in the sorted keys and at which position
+    (positions of missing values are valid indexes, but meaningless).
+    """
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=bool), np.zeros(len(query), dtype=np.int64)
+    pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return keys[pos] == query, pos
+
+
+def read_corpus(fname, plain):
+    """
+    Read the corpus into a byte array, and return it along with the start and end
+    offsets of every password and their counts.
+    """
+    space = np.zeros(256, dtype=bool)
+    space[[ord(c) for c in WHITESPACE]] = True
+    buf = np.fromfile(fname, dtype=np.uint8)
+    if len(buf) == 0 or buf[-1] != ord("\n"):
+        buf = np.append(buf, np.uint8(ord("\n")))
+    ends = np.flatnonzero(buf == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    if plain:
+        delimiter = 0
+        counts = np.ones(len(starts), dtype=np.int64)
+    else:
+        # First line is the index of delimiter, then "${count} ${word}"
+        delimiter = int(buf[starts[0]:ends[0]].tostring())
+        starts, ends = starts[1:], ends[1:]
+        # Parse counts as int(l[:delimiter]) does in statgen-additive.py: digits with
+        # optional whitespace around them, e.g. right-aligned as by `uniq -c`
+        counts = np.zeros(len(starts), dtype=np.int64)
+        digits = np.zeros(len(starts), dtype=np.int64)     # Digits seen so far
+        past = np.zeros(len(starts), dtype=bool)            # Whitespace after digits
+        bad = np.zeros(len(starts), dtype=bool)
+        for j in xrange(delimiter):
+            in_field = starts + j < ends
+            byte = buf[np.minimum(starts + j, ends)]
+            digit = byte.astype(np.int64) - ord("0")
+            is_digit = in_field & (digit >= 0) & (digit <= 9)
+            is_space = in_field & space[byte]
+            bad |= (in_field & ~is_digit & ~is_space) | (past & is_digit)
+            take = is_digit & ~past
+            counts[take] = counts[take] * 10 + digit[take]
+            digits += take
+            past |= is_space & (digits > 0)
+        bad |= digits == 0
+        if bad.any():
+            raise ValueError("Invalid count on line {} of {}".format(np.flatnonzero(bad)[0] + 2, fname))
+
+    # Strip the word on both sides
+    starts = np.minimum(starts + delimiter, ends)
+    while True:
+        strip = (starts < ends) & space[buf[np.minimum(starts, len(buf) - 1)]]
+        if not strip.any():
+            break
+        starts += strip
+    while True:
+        strip = (starts < ends) & space[buf[np.maximum(ends - 1, 0)]]
+        if not strip.any():
+            break
+        ends -= strip
+    return buf, starts, ends, counts
+
+
+def statgen_total(fname):
+    """
+    Total count of the corpus as parsed by statgen-additive.py, to check ours against.
+    """
+    with open(fname, 'r') as f:
+        delimiter = int(f.readline())
+        return sum(int(l[:delimiter]) for l in f)
+
+
+def analyze(buf, starts, ends, counts, model, scores=None):
+    """
+    Level histogram of the corpus: {(length, level): [passwords, count]}, plus the
+    number of passwords skipped for being too short or out of alphabet.
+    """
+    char_code = np.full(256, INVALID, dtype=np.uint8)
+    for i, c in enumerate(ALPHABET):
+        char_code[ord(c)] = i
+
+    histogram = {}
+    skipped = [0, 0]
+    lengths = ends - starts
+    for length in np.flatnonzero(np.bincount(lengths)):
+        rows = np.flatnonzero(lengths == length)
+        if length < model.k - 1:
+            skipped[0] += len(rows)
+            skipped[1] += int(counts[rows].sum())
+            continue
+        codes = char_code[buf[starts[rows][:, None] + np.arange(length)]]
+        supported = (codes != INVALID).all(axis=1)
+        skipped[0] += int((~supported).sum())
+        skipped[1] += int(counts[rows[~supported]].sum())
+        rows, codes = rows[supported], codes[supported]
+        if len(rows) == 0:
+            continue
+
+        level, logp = model.score(codes)
+        occupancy = np.bincount(level - NO_LEVEL)
+        weight = np.bincount(level - NO_LEVEL, weights=counts[rows])
+        for lvl in np.flatnonzero(occupancy):
+            histogram[(int(length), int(lvl) + NO_LEVEL)] = [int(occupancy[lvl]), int(weight[lvl])]
+
+        if scores is not None:
+            for row, l, p in zip(rows, level, logp):
+                scores.write("{}\t{}\t{}\t{:.6f}\n".format(
+                    buf[starts[row]:ends[row]].tostring(), length, l, p))
+    return histogram, skipped
+
+
+def coverage(histogram, available):
+    """
+    Number of passwords, and their total count, in buckets with checkpoints.
+    """
+    covered = [0, 0]
+    for (length, level), (passwords, count) in histogram.iteritems():
+        if length in available and level in available[length]:
+            covered[0] += passwords
+            covered[1] += count
+    return covered
+
+
+if __name__ == "__main__":
+    if np is None:
+        print("This script requires NumPy!\n")
+        sys.exit(1)
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    PLAIN = "--plain" in sys.argv[1:]
+    SCORES = "--scores" in sys.argv[1:]
+    CHECK = "--check" in sys.argv[1:]
+    INPUT_FILE = args[0] if args else PASSWD_FILE
+    OUTPUT_FILE = OUTPUT_PREFIX + "{}_{}_levels.json".format(guess.K, guess.SMOOTHING)
+    SCORES_FILE = OUTPUT_PREFIX + "{}_{}_scores.tsv".format(guess.K, guess.SMOOTHING)
+
+    print("Parameters of model: k={}, smoothing={}".format(guess.K, guess.SMOOTHING))
+    guess.load_levels(guess.K, guess.SMOOTHING)
+    model = ModelArrays(guess.levels, PROBS_PREFIX)
+
+    print("Reading passwords from {}...".format(INPUT_FILE))
+    start = time.time()
+    buf, starts, ends, counts = read_corpus(INPUT_FILE, PLAIN)
+    scores = open(SCORES_FILE, 'w') if SCORES else None
+    histogram, skipped = analyze(buf, starts, ends, counts, model, scores)
+    if scores is not None:
+        scores.close()
+    elapsed = time.time() - start
+
+    if CHECK and not PLAIN:
+        expected = statgen_total(INPUT_FILE)
+        if int(counts.sum()) != expected:
+            print("ERROR: Total count {} differs from {} of statgen-additive.py!".format(
+                int(counts.sum()), expected))
+            sys.exit(1)
+        print("Total count matches statgen-additive.py: {}".format(expected))
+
+    total = [sum(v[0] for v in histogram.itervalues()), sum(v[1] for v in histogram.itervalues())]
+    covered = coverage(histogram, guess.AVAILABLE_CP)
+    print("Analyzed {} passwords in {:.2f}s ({:.0f} per second)".format(
+        len(starts), elapsed, len(starts) / max(elapsed, 1e-9)))
+    print("Skipped {} passwords too short or out of alphabet".format(skipped[0]))
+    print("Covered by checkpoints: {} of {} passwords, {} of {} by count".format(
+        covered[0], total[0], covered[1], total[1]))
+
+    result = {"k": guess.K,
+              "smoothing": guess.SMOOTHING,
+              "input": INPUT_FILE,
+              "buckets": {"{}_{}".format(length, level): {"passwords": v[0], "count": v[1]}
+                          for (length, level), v in histogram.iteritems()},
+              "skipped": {"passwords": skipped[0], "count": skipped[1]},
+              "total": {"passwords": total[0], "count": total[1]},
+              "covered": {"passwords": covered[0], "count": covered[1]},
+              }
+    if not os.path.isdir(OUTPUT_PREFIX):
+        os.makedirs(OUTPUT_PREFIX)
+    with open(OUTPUT_FILE, 'w') as f:
+        json.dump(result, f, sort_keys=True, indent=4)
+    print("Writing output to {}...".format(OUTPUT_FILE))
+    print("Done!")
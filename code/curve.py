@@ -0,0 +1,103 @@
+# Guessing curve of a test set under the model in guess.py
+#
+# Input:
+#   - Level index and checkpoints of the model, as for guess.py
+#   - Test passwords, by default ../data/input/dataset-ascii.csv in the format
+#     read by statgen-additive.py, or one password per line with --plain
+#
+# Output: ../data/curves/${k}_${smoothing}.tsv with one line per distinct guess
+#   number: "${guesses}\t${cracked}\t${percent}", i.e. how many test passwords (by
+#   count) are guessed within that many guesses, and their percentage of the test
+#   set. Passwords beyond our index space count as never cracked.
+#
+# Guess numbers come from guess_numbers() in guess.py, which resolves the whole
+# test set with one pass per (length, level) bucket rather than one per password.
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import os                               # For path expansion
+import sys                              # For argv and exit
+import time                             # For timing
+
+import guess                            # Model and batch scoring
+
+# Current directory of script
+CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
+# Input password file
+PASSWD_FILE = os.path.join(CURRENT_DIR, "../data/input/dataset-ascii.csv")
+# Output directory for curves
+OUTPUT_PREFIX = os.path.join(CURRENT_DIR, "../data/curves/")
+
+
+def read_test_set(fname, plain):
+    """
+    Return the mapping from each test password to its count.
+    """
+    counts = {}
+    with open(fname, 'r') as f:
+        if plain:
+            for l in f:
+                word = l.rstrip("\r\n")
+                counts[word] = counts.get(word, 0) + 1
+        else:
+            delimiter = int(f.readline())
+            for l in f:
+                word = l[delimiter:].strip()
+                counts[word] = counts.get(word, 0) + int(l[:delimiter])
+    return counts
+
+
+def guessing_curve(counts, guess_numbers):
+    """
+    Given test passwords with their counts and guess numbers, return the list of
+    (guesses, cracked) pairs at every distinct guess number, and the total count.
+    """
+    cracked = {}
+    for pw, count in counts.iteritems():
+        guesses = guess_numbers[pw]
+        if guesses is not None:
+            cracked[guesses] = cracked.get(guesses, 0) + count
+
+    curve = []
+    total = 0
+    for guesses in sorted(cracked):
+        total += cracked[guesses]
+        curve.append((guesses, total))
+    return curve, sum(counts.itervalues())
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    PLAIN = "--plain" in sys.argv[1:]
+    INPUT_FILE = args[0] if args else PASSWD_FILE
+    OUTPUT_FILE = OUTPUT_PREFIX + "{}_{}.tsv".format(guess.K, guess.SMOOTHING)
+
+    print("Parameters of model: k={}, smoothing={}".format(guess.K, guess.SMOOTHING))
+    guess.load_levels(guess.K, guess.SMOOTHING)
+
+    print("Reading test set from {}...".format(INPUT_FILE))
+    counts = read_test_set(INPUT_FILE, PLAIN)
+
+    print("Guessing {} distinct passwords...".format(len(counts)))
+    start = time.time()
+    curve, total = guessing_curve(counts, guess.guess_numbers(counts))
+    print("Done in {:.2f}s".format(time.time() - start))
+
+    if not os.path.isdir(OUTPUT_PREFIX):
+        os.makedirs(OUTPUT_PREFIX)
+    with open(OUTPUT_FILE, 'w') as f:
+        for guesses, cracked in curve:
+            f.write("{}\t{}\t{:.4f}\n".format(guesses, cracked, 100.0 * cracked / total))
+
+    # Summary at powers of 10
+    threshold = 10
+    i = 0
+    cracked = 0
+    while curve and threshold <= curve[-1][0] * 10:
+        while i < len(curve) and curve[i][0] <= threshold:
+            cracked = curve[i][1]
+            i += 1
+        print("{:>16n} guesses: {:6.2f}% cracked".format(threshold, 100.0 * cracked / total))
+        threshold *= 10
+    print("Writing output to {}...".format(OUTPUT_FILE))
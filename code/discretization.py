@@ -8,6 +8,9 @@
 #     from a probability level to prefixes and suffixes;
 #   - For transition probabilities, return the mapping from each (k-1)-
 #     gram to an inner mapping from level to next characters.
+#   - Parameters of the model: k, smoothing, max-level and the scaling
+#     factors of each of the above, read back by checkpoint.py, guess.py and
+#     registry.py.
 #   The outputs are written to ../data/levels/*_*_*.json.
 #
 # For 08-731 F15
@@ -64,12 +67,15 @@ def report_levels(k, s):
     """
     Build the discrete index based on input file of probabilities.
     """
+    scaling = {}
+
     ##################################
     # Build level index for StartProbs
     file_name = INPUT_PREFIX + "{}_{}_start.json".format(k, s)
     with open(file_name, 'r') as f:
         start_p = json.load(f)
     (c1, c2) = calc_scaling(start_p)
+    scaling["start"] = {"c1": c1, "c2": c2}
 
     start_lvl = defaultdict(lambda: [])
     for prefix in start_p:
@@ -90,6 +96,7 @@ def report_levels(k, s):
     with open(file_name, 'r') as f:
         end_p = json.load(f)
     (c1, c2) = calc_scaling(end_p)
+    scaling["end"] = {"c1": c1, "c2": c2}
 
     end_lvl = defaultdict(lambda: [])
     for suffix in end_p:
@@ -110,6 +117,7 @@ def report_levels(k, s):
     with open(file_name, 'r') as f:
         mid_p = json.load(f)
     (c1, c2) = calc_scaling(mid_p, True)    # Signal double-layer dictionary
+    scaling["mid"] = {"c1": c1, "c2": c2}
 
     mid_lvl = defaultdict(lambda: defaultdict(lambda: []))
     for prefix in mid_p:
@@ -125,6 +133,18 @@ def report_levels(k, s):
     del(mid_p)
     del(mid_lvl)
 
+    ################################
+    # Record parameters of the model
+    meta = {"k": k,
+            "smoothing": s,
+            "max_level": LEVEL,
+            "scaling": scaling,
+            }
+    outfile = OUTPUT_PREFIX + "{}_{}_meta.json".format(k, s)
+    print("Writing output to {}...".format(outfile))
+    with open(outfile, 'w') as f:
+        json.dump(meta, f, sort_keys=True, indent=4)
+
 
 if __name__ == "__main__":
     print("Building inverted index with max-lvl {} from input ../data/probs/*".format(LEVEL))
@@ -10,15 +10,17 @@
 # For 08-731 F15
 # Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
 
-import json                             # For JSON I/O
 import os                               # For path expansion
 import sys                              # For argv and exit
 import math                             # For log, round
-from collections import defaultdict     # Easier index mgmt
-import string                           # Use string constants
-import itertools                        # Fancy list functions
 import locale                           # For readable numeric output
 
+from alphabet import ALPHABET_SIZE, decode, encode, gram_chars, is_supported
+from level_index import LevelIndex, WILDCARD, model_params
+from cache import GuessCache, MISSING
+import profiling                        # Counters and phase timers
+from shared_model import SharedLevelIndex
+
 locale.setlocale(locale.LC_ALL, '')
 
 # Colorful shell output! :)
@@ -36,10 +38,6 @@ class color:
     UNDERLINE = '\033[4m'
     END = '\033[0m'
 
-# Valid chars in password
-ALPHABET = string.digits + string.ascii_letters
-ALPHABET_SIZE = len(ALPHABET)
-
 # Checkpoint parameters
 K = 3
 SMOOTHING = "additive"
@@ -52,7 +50,8 @@ CHECKPOINT_FREQUENCY = 10000
 MAX_LEVEL = 10
 MAX_LENGTH = 12
 
-# Scaling factors for probability (curated for k=3 with smoothing)
+# Scaling factors for probability (curated for k=3 with smoothing), used unless the
+# model comes with its own from discretization.py
 c1 = 1.11439835558
 c2 = 4.53959983946e-05
 # Default lvl for next char
@@ -69,96 +68,137 @@ CHECKPOINT_PREFIX = os.path.join(CURRENT_DIR, "../data/cps/{}_{}/".format(K, SMO
 AVAILABLE_CP = {4: xrange(33), 5: xrange(35), 6: xrange(33), 7: xrange(
     28), 8: xrange(25), 9: xrange(23), 10: xrange(22), 11: xrange(21), 12: xrange(21)}
 
+# Caches of the scoring path, off unless enable_cache() is called
+cache = None
+
+# Counters and phase timers, off (None) unless enabled, see profiling.py
+profile = profiling.from_environment()
+
+# (length, level) -> number of passwords enumerated before that bucket, built
+# on first use by bucket_offset()
+bucket_offsets = None
+
+# When not None, the DFS records every password it counts here instead of
+# looking for pw_codes, and stops once guess_count reaches window_end
+window = None
+window_end = 0
+
+# When not None, the DFS looks for these password codes, in reverse DFS order, instead
+# of pw_codes; it records the guess count of each one it meets in target_counts, and
+# stops once all of them are met
+targets = None
+target_counts = None
+
 
 def load_levels(k, smoothing):
     ##################
     # Load input files
-    global start_lvl
-    global end_lvl
-    global mid_lvl
-
-    file_name = LEVEL_PREFIX + "{}_{}_start.json".format(k, smoothing)
-    with open(file_name, 'r') as f:
-        global start_lvl
-        start_lvl = json.load(f)
-    start_lvl = {int(key): val for key, val in start_lvl.iteritems()}
-    global start_tokens
-    start_tokens = set(itertools.chain.from_iterable(
-        start_lvl.values()))   # Record all starting (k-1)-grams
-
-    file_name = LEVEL_PREFIX + "{}_{}_end.json".format(k, smoothing)
-    with open(file_name, 'r') as f:
-        global end_lvl
-        end_lvl = json.load(f)
-    end_lvl = {int(key): val for key, val in end_lvl.iteritems()}
-    global end_tokens
-    end_tokens = set(itertools.chain.from_iterable(end_lvl.values())
-                     )       # Record all ending (k-1)-grams
-
-    file_name = LEVEL_PREFIX + "{}_{}_mid.json".format(k, smoothing)
-    with open(file_name, 'r') as f:
-        global mid_lvl
-        mid_lvl = json.load(f)
-    for prefix in mid_lvl:
-        mid_lvl[prefix] = {int(key): val for key, val in mid_lvl[prefix].iteritems()}
-    global mid_tokens
-    mid_tokens = {key: set(itertools.chain.from_iterable(val.values()))
-                  for key, val in mid_lvl.iteritems()}  # Record chars after (k-1)-gram
+    global levels
+    global bucket_offsets
+    global c1
+    global c2
+    global NEXT_CHR_LVL
+    global MAX_LEVEL
+
+    # Parameters of the model, if recorded by discretization.py
+    c1, c2, NEXT_CHR_LVL, MAX_LEVEL = model_params(LEVEL_PREFIX, k, smoothing, c1, c2, MAX_LEVEL)
+
+    with profiling.phase(profile, "load"):
+        levels = LevelIndex(LEVEL_PREFIX, k, smoothing, NEXT_CHR_LVL)
+    bucket_offsets = None
+    if cache is not None:
+        cache.validate(model_version())
+    if profile is not None:
+        profile.report(event="load", k=k, smoothing=smoothing)
+
+
+def attach_levels(path):
+    """
+    Use the model file written by shared_model.py instead of loading the level
+    files. The file is mapped read-only, so all processes attached to it share a
+    single copy of the level index and checkpoints.
+    """
+    global levels
+    global bucket_offsets
+    global NEXT_CHR_LVL
+    global MAX_LEVEL
+    levels = SharedLevelIndex(path)
+    NEXT_CHR_LVL = levels.next_chr_lvl     # As the file was exported with
+    if levels.max_level is not None:       # Not recorded by older files
+        MAX_LEVEL = levels.max_level
+    bucket_offsets = None
+    if cache is not None:
+        cache.validate(model_version())
+
+
+def model_version():
+    """
+    Version of the loaded model, which caches are tied to: that of its level files,
+    plus (name, mtime, size) of its checkpoint files, so that running checkpoint.py
+    again drops stale totals, windows and guesses on the next load.
+    """
+    if isinstance(levels, SharedLevelIndex):
+        # Checkpoints are held in the model file
+        st = os.stat(levels.path)
+        return levels.version + ((int(st.st_mtime), st.st_size),)
+    files = ()
+    if os.path.isdir(CHECKPOINT_PREFIX):
+        for fname in sorted(os.listdir(CHECKPOINT_PREFIX)):
+            if fname.endswith(".out"):
+                st = os.stat(CHECKPOINT_PREFIX + fname)
+                files += ((fname, int(st.st_mtime), st.st_size),)
+    return levels.version + files
+
+
+def enable_profiling(log=None):
+    """
+    Turn on counters and phase timers. A report is built for every query (see
+    profiling.py), kept as profile.last_report and also sent to log if given.
+    """
+    global profile
+    profile = profiling.Profile(log)
+    return profile
+
+
+def enable_cache(**capacities):
+    """
+    Turn on the caches of the scoring path for the loaded model. See cache.py
+    for the capacities that may be given.
+    """
+    global cache
+    cache = GuessCache(model_version(), **capacities)
+    return cache
 
 
 def decompose_password(pw, k):
     """
     Given a password, go through it char-by-char and return a tuple of tuples of the form
-    (level, idx, prefix / char). level stands for the level of the prefix / next char;
-    idx stands for the index of the option in the level index; prefix / char stand for the
-    actual prefix / next char.
+    (level, idx, code). level stands for the level of the prefix / next char; idx stands
+    for the index of the option in the level index; code stands for the integer code of the
+    actual prefix / next char (see alphabet.py), which orders wildcard expansions the same
+    way the DFS enumerates them.
 
     The purpose of this is that we may compare two passwords with same length and total level
     with this tuple, in order to get their comparative order in the DFS sequence.
+
+    Returns None if the model gives the password zero probability (unsmoothed models only),
+    as such a password is never enumerated.
     """
-    result = ()
+    assert(k == levels.k)
+    if profile is not None:
+        profile.decompose += 1
+    return levels.decompose(encode(pw))
 
-    # Level for prefix
-    prefix = pw[:(k - 1)]
-    found = False
-    index = -1
-    for l in start_lvl:
-        if prefix in start_lvl[l]:
-            found = True
-            index = start_lvl[l].index(prefix)
-            break
-    # Does not appear in index, must be wildcard
-    if not found:
-        for l in start_lvl:
-            if "" in start_lvl[l]:
-                index = start_lvl[l].index("")
-                break
-    assert(index >= 0)
-    result += ((l, index, prefix),)
-
-    # Level for intermediate characters
-    for i in xrange(0, len(pw) - k + 1):
-        prefix = pw[i: i + k - 1]
-        # Prefix not in index -- all is wildcard case
-        if prefix not in mid_lvl:
-            result += ((NEXT_CHR_LVL, ALPHABET.index(pw[i + k - 1]), pw[i + k - 1]), )
-            continue
-        # Prefix in index -- find corresponding level
-        found = False
-        index = -1
-        for l in mid_lvl[prefix]:
-            if pw[i + k - 1] in mid_lvl[prefix][l]:
-                found = True
-                index = mid_lvl[prefix][l].index(pw[i + k - 1])
-                break
-        if not found:
-            for l in mid_lvl[prefix]:
-                if "" in mid_lvl[prefix][l]:
-                    index = mid_lvl[prefix][l].index("")
-                    break
-        assert(index >= 0)
-        result += ((l, index, pw[i + k - 1]), )
-    return result
+
+def in_index_space(pw):
+    """
+    Whether the password may be scored at all: all its chars are in the alphabet
+    and there are checkpoints of its length. Entry points check this before
+    decomposing, and treat a password decomposing to None (zero probability) the
+    same way, so that any user input gets a guess number of None (and is never
+    within a threshold) rather than an error.
+    """
+    return len(pw) in AVAILABLE_CP and is_supported(pw)
 
 
 def skip_prev_cases(LEN, LVL):
@@ -170,26 +210,93 @@ def skip_prev_cases(LEN, LVL):
     global guess_count
 
     max_complexity = LEN + LVL / LVL_FACTOR
-    found = False
+    for ln, lvl in bucket_order():
+        if ln + lvl / LVL_FACTOR > max_complexity:
+            break
+        if (ln, lvl) == (LEN, LVL):
+            return True
+        # Accumulate counts of prior cases
+        guess_count += bucket_total(ln, lvl)
+    return False
+
+
+def bucket_order():
+    """
+    Generate all available (length, level) pairs in the order we enumerate them, i.e.
+    by increasing complexity value (len + lvl / beta), then by length.
+    """
+    max_complexity = max(ln + max(AVAILABLE_CP[ln]) / LVL_FACTOR for ln in AVAILABLE_CP)
     for complexity in xrange(max_complexity + 1):
-        for ln in xrange(min(AVAILABLE_CP.keys()), max(AVAILABLE_CP.keys()) + 1):
+        for ln in sorted(AVAILABLE_CP):
             for lvl in xrange((complexity - ln) * LVL_FACTOR, (complexity - ln + 1) * LVL_FACTOR):
                 if lvl not in AVAILABLE_CP[ln]:
                     continue
-                if (ln, lvl) == (LEN, LVL):
-                    return True
-                # Accumulate counts of prior cases
-                # Note: For large files, only seek for the last line
-                MAX_LINE = 100
-                SEEK_END = 2
-                f = open(CHECKPOINT_PREFIX + "{}_{}.out".format(ln, lvl))
-                try:
-                    f.seek(-MAX_LINE, SEEK_END)
-                    guess_count += int(f.read(MAX_LINE).splitlines()[-1])
-                except IOError:
-                    guess_count += int(f.read().splitlines()[-1])
-                f.close()
-    return False
+                yield (ln, lvl)
+
+
+def bucket_offset(LEN, LVL):
+    """
+    Number of passwords enumerated before the (length, level) bucket, or None if it
+    is beyond our index space. Offsets of all buckets are summed up once on first use.
+    """
+    global bucket_offsets
+
+    if bucket_offsets is None:
+        offsets = {}
+        count = 0
+        for ln, lvl in bucket_order():
+            offsets[(ln, lvl)] = count
+            count += bucket_total(ln, lvl)
+        bucket_offsets = offsets
+    return bucket_offsets.get((LEN, LVL))
+
+
+def index_space_size():
+    """
+    Number of passwords in our index space, i.e. in all checkpointed buckets.
+    """
+    return sum(bucket_total(ln, lvl) for ln, lvl in bucket_order())
+
+
+def bucket_total(LEN, LVL):
+    """
+    Number of passwords with the given (length, level), as recorded on the last
+    line of its checkpoint file.
+    """
+    if cache is not None and (LEN, LVL) in cache.totals:
+        return cache.totals[(LEN, LVL)]
+    if levels.checkpoints is not None:
+        return levels.checkpoints.total(LEN, LVL)
+    # Note: For large files, only seek for the last line
+    MAX_LINE = 100
+    SEEK_END = 2
+    f = open(CHECKPOINT_PREFIX + "{}_{}.out".format(LEN, LVL))
+    try:
+        f.seek(-MAX_LINE, SEEK_END)
+        total = int(f.read(MAX_LINE).splitlines()[-1])
+    except IOError:
+        total = int(f.read().splitlines()[-1])
+    f.close()
+    if cache is not None:
+        cache.totals[(LEN, LVL)] = total
+    return total
+
+
+def read_checkpoint(LEN, LVL):
+    """
+    Checkpoint passwords of the given (length, level).
+    """
+    if cache is not None:
+        current_cp = cache.checkpoints.get((LEN, LVL))
+        if current_cp is not None:
+            return current_cp
+    if levels.checkpoints is not None:
+        return levels.checkpoints.passwords(LEN, LVL)
+    with open(CHECKPOINT_PREFIX + "{}_{}.out".format(LEN, LVL)) as f:
+        current_cp = f.read().splitlines()[:-2]     # Entire file excluding last two summary lines
+    if cache is not None:
+        cache.checkpoints.put((LEN, LVL), current_cp)
+    return current_cp
 
 
 def binary_search(list, pw_components):
@@ -206,7 +313,7 @@ def binary_search(list, pw_components):
     tail = len(list) - 1        # Inclusive
     while head <= tail:
         mid = (head + tail) / 2
-        mid_pass = decompose_password(list[mid], K)
+        mid_pass = decompose_password(list[mid], levels.k)
         if mid_pass > pw_components:
             tail = mid - 1
         else:
@@ -214,93 +321,460 @@ def binary_search(list, pw_components):
     return head
 
 
-def dfs_passwords(l, k, next_idx, passwd, remaining_lvl, lower_bound=None):
+def dfs_passwords(l, k, next_idx, passwd, prefix, remaining_lvl, lower_bound=None,
+                  component=None):
     """
     Nearly identical to the dfs function in checkpoint.py, except that we simplify
     it to discard the "one more char" case and include a lower_bound parameter for
     DFS pruning. Also, now the function returns True if the current run matches the
-    desired password.
+    desired password. component is the (level, idx, code) of the last chosen prefix /
+    char, which is checked against the lower bound.
     """
     global guess_count
-    global pw
+    if profile is not None:
+        profile.nodes += 1
     # Before anything else, validate the lower bound for previously chosen prefix / char.
-    if lower_bound and next_idx > 0:
-        prev_last_component = decompose_password(passwd, k)[-1]
-        if lower_bound[0] < prev_last_component:
+    if lower_bound and component is not None:
+        if lower_bound[0] < component:
             lower_bound = None
-        elif lower_bound[0] == prev_last_component:
+        elif lower_bound[0] == component:
             lower_bound = lower_bound[1:]
             if len(lower_bound) == 0:
                 lower_bound = None
-        else:   # prev_last_component < lower_bound
+        else:   # component < lower_bound
+            if profile is not None:
+                profile.pruned += 1
             return False    # Prune
 
     # Finishing case
     if next_idx == l:   # End of password
         if remaining_lvl == 0:
             guess_count += 1
-            if passwd == pw:
+            if profile is not None:
+                profile.leaves += 1
+            if window is not None:
+                window[decode(passwd)] = guess_count
+                return guess_count == window_end
+            if targets is not None:
+                if passwd != targets[-1]:
+                    return False
+                target_counts[decode(passwd)] = guess_count
+                targets.pop()
+                return len(targets) == 0
+            if passwd == pw_codes:
                 return True
+        elif profile is not None:
+            profile.pruned += 1
         return False     # Bad case!
-    # Trim impossible cases
-    elif MAX_LEVEL * (l - next_idx) < remaining_lvl:
+    # Trim impossible cases (levels are never negative)
+    elif MAX_LEVEL * (l - next_idx) < remaining_lvl or remaining_lvl < 0:
+        if profile is not None:
+            profile.pruned += 1
         return False
     # Initial case
     elif next_idx == 0:
         for init_level in xrange(0, min(remaining_lvl, MAX_LEVEL) + 1):  # !!!
-            if init_level not in start_lvl:
+            if init_level not in levels.start_lvl:
                 continue
-            for init_sequence in start_lvl[init_level]:
-                if init_sequence != "":
+            for idx, init_sequence in enumerate(levels.start_lvl[init_level]):
+                if init_sequence != WILDCARD:
                     # Normal case
-                    result = dfs_passwords(l, k, k - 1, init_sequence,
-                                           remaining_lvl - init_level, lower_bound)
+                    result = dfs_passwords(l, k, k - 1, gram_chars(init_sequence, k - 1),
+                                           init_sequence, remaining_lvl - init_level,
+                                           lower_bound, (init_level, idx, init_sequence))
                     if result:
                         return True
                 else:
                     # Wildcard case...
-                    for init_seq in ("".join(k) for k in itertools.product(ALPHABET, repeat=k - 1)):
-                        if init_seq in start_tokens:
-                            continue
-                        result = dfs_passwords(l, k, k - 1, init_seq,
-                                               remaining_lvl - init_level, lower_bound)
+                    for init_seq in levels.start_wildcards():
+                        if profile is not None:
+                            profile.wildcards += 1
+                        result = dfs_passwords(l, k, k - 1, gram_chars(init_seq, k - 1),
+                                               init_seq, remaining_lvl - init_level,
+                                               lower_bound, (init_level, idx, init_seq))
                         if result:
                             return True
     # Intermediate case
     else:
-        prefix = passwd[-(k - 1):]
-        if prefix not in mid_lvl:
+        # Code of the next prefix is shifted + next char
+        shifted = (prefix % levels.shift_mod) * ALPHABET_SIZE
+        table = levels.mid_lvl.get(prefix)
+        if table is None:
             # Special case when we apply uniform probability to everything
-            for c in ALPHABET:
-                result = dfs_passwords(l, k, next_idx + 1, passwd + c,
-                                       remaining_lvl - NEXT_CHR_LVL, lower_bound)
+            if remaining_lvl < NEXT_CHR_LVL:
+                if profile is not None:
+                    profile.pruned += 1
+                return False
+            if profile is not None:
+                profile.wildcards += ALPHABET_SIZE
+            for c in xrange(ALPHABET_SIZE):
+                passwd.append(c)
+                result = dfs_passwords(l, k, next_idx + 1, passwd, shifted + c,
+                                       remaining_lvl - NEXT_CHR_LVL, lower_bound,
+                                       (NEXT_CHR_LVL, c, c))
+                passwd.pop()
                 if result:
                     return True
             return False
         # Regular case
         for next_level in xrange(0, min(remaining_lvl, MAX_LEVEL) + 1):  # !!!
-            if next_level not in mid_lvl[prefix]:
+            if next_level not in table:
                 continue
-            for next_chr in mid_lvl[prefix][next_level]:
+            for idx, next_chr in enumerate(table[next_level]):
                 # Wildcard case...
-                if next_chr == "":
-                    for c in ALPHABET:
-                        if c in mid_tokens[prefix]:
-                            continue
-                        result = dfs_passwords(l, k, next_idx + 1, passwd +
-                                               c, remaining_lvl - next_level, lower_bound)
+                if next_chr == WILDCARD:
+                    if profile is not None:
+                        profile.wildcards += len(levels.mid_wildcards(prefix))
+                    for c in levels.mid_wildcards(prefix):
+                        passwd.append(c)
+                        result = dfs_passwords(l, k, next_idx + 1, passwd, shifted + c,
+                                               remaining_lvl - next_level, lower_bound,
+                                               (next_level, idx, c))
+                        passwd.pop()
                         if result:
                             return True
                 # Normal case
                 else:
-                    result = dfs_passwords(l, k, next_idx + 1, passwd +
-                                           next_chr, remaining_lvl - next_level, lower_bound)
+                    passwd.append(next_chr)
+                    result = dfs_passwords(l, k, next_idx + 1, passwd, shifted + next_chr,
+                                           remaining_lvl - next_level, lower_bound,
+                                           (next_level, idx, next_chr))
+                    passwd.pop()
                     if result:
                         return True
     return False    # No luck this time :(
 
 
+def search_window(LEN, LVL, current_cp, idx):
+    """
+    Enumerate every password between checkpoints idx - 1 and idx of the given
+    (length, level), and return the mapping from each of them to its guess count
+    within the bucket. Only used with caching on, as the window gets cached.
+    """
+    global guess_count
+    global window
+    global window_end
+
+    skipped = guess_count
+    window = {}
+    window_end = (idx + 1) * CHECKPOINT_FREQUENCY - 1   # Right before checkpoint idx
+    if idx == 0 or len(current_cp) == 0:
+        lower_bound = None
+        guess_count = 0
+    else:
+        lower_bound = decompose_password(current_cp[idx - 1], levels.k)
+        guess_count = idx * CHECKPOINT_FREQUENCY - 1    # Lower bound itself comes first
+    try:
+        dfs_passwords(LEN, levels.k, 0, [], 0, LVL, lower_bound)
+        result = window
+    finally:
+        window = None
+        guess_count = skipped
+    cache.windows.put((LEN, LVL, idx), result)
+    return result
+
+
+def search_targets(LEN, LVL, current_cp, idx, passwords):
+    """
+    Given passwords of the (length, level) bucket, all between checkpoints idx - 1
+    and idx and in DFS order, find them all in a single DFS from checkpoint idx - 1.
+    Return the mapping from each of them to its guess count within the bucket.
+    """
+    global guess_count
+    global targets
+    global target_counts
+
+    skipped = guess_count
+    targets = [encode(pw) for pw in reversed(passwords)]
+    target_counts = {}
+    if idx == 0 or len(current_cp) == 0:
+        lower_bound = None
+        guess_count = 0
+    else:
+        lower_bound = decompose_password(current_cp[idx - 1], levels.k)
+        guess_count = idx * CHECKPOINT_FREQUENCY - 1    # Lower bound itself comes first
+    try:
+        dfs_passwords(LEN, levels.k, 0, [], 0, LVL, lower_bound)
+        result = target_counts
+    finally:
+        targets = None
+        target_counts = None
+        guess_count = skipped
+    return result
+
+
+def rank_bucket(LEN, LVL, members):
+    """
+    Given (components, password) pairs of the (length, level) bucket sorted in DFS
+    order, return the mapping from each password to its guess count within the
+    bucket. The checkpoints are merged with the passwords in a single pass, and the
+    passwords sharing a checkpoint window are found by one DFS.
+    """
+    with profiling.phase(profile, "read_checkpoint"):
+        current_cp = read_checkpoint(LEN, LVL)
+
+    # Same index as binary_search: number of checkpoints enumerated no later than pw
+    with profiling.phase(profile, "merge_checkpoints"):
+        windows = []
+        idx = 0
+        cp_components = None
+        for components, pw in members:
+            while idx < len(current_cp):
+                if cp_components is None:
+                    cp_components = decompose_password(current_cp[idx], levels.k)
+                if cp_components > components:
+                    break
+                idx += 1
+                cp_components = None
+            if windows and windows[-1][0] == idx:
+                windows[-1][1].append(pw)
+            else:
+                windows.append((idx, [pw]))
+
+    counts = {}
+    with profiling.phase(profile, "dfs"):
+        for idx, passwords in windows:
+            window_counts = cache.windows.get((LEN, LVL, idx)) if cache is not None else None
+            if window_counts is not None:
+                counts.update((pw, window_counts[pw]) for pw in passwords)
+            else:
+                counts.update(search_targets(LEN, LVL, current_cp, idx, passwords))
+    return counts
+
+
+def rank_in_bucket(pw, components, LVL, verbose=False):
+    """
+    Given a password along with its components and total level, add its guess count
+    within its own (length, level) bucket to guess_count. We binary search for the
+    closest checkpoint before it, then run the DFS from there.
+    """
+    global guess_count
+    global pw_codes
+
+    LEN = len(pw)
+    pw_codes = encode(pw)
+    with profiling.phase(profile, "read_checkpoint"):
+        current_cp = read_checkpoint(LEN, LVL)
+    with profiling.phase(profile, "binary_search"):
+        idx = max(0, binary_search(current_cp, components))
+    if verbose:
+        print("Using binary search to estimate guess count...")
+        print "Narrowed search between {:n} and {:n}".format(
+            guess_count + idx * CHECKPOINT_FREQUENCY, guess_count + (idx + 1) * CHECKPOINT_FREQUENCY)
+
+    if cache is not None:
+        # Fill the window on its second query only, see cache.py
+        key = (LEN, LVL, idx)
+        with profiling.phase(profile, "dfs"):
+            window_counts = cache.windows.get(key)
+            if window_counts is None and cache.window_queries.get(key) is not None:
+                window_counts = search_window(LEN, LVL, current_cp, idx)
+            if window_counts is not None:
+                guess_count += window_counts[pw]
+                return
+        cache.window_queries.put(key, True)
+
+    guess_count += idx * CHECKPOINT_FREQUENCY
+    # Construct lower bound in DFS
+    if idx == 0 or len(current_cp) == 0:
+        lower_bound = None
+    else:
+        lower_bound = decompose_password(current_cp[idx - 1], levels.k)
+        guess_count -= 1    # DFS counts the lower bound password itself once more
+
+    with profiling.phase(profile, "dfs"):
+        dfs_passwords(LEN,            # total length,
+                      levels.k,     # k-gram model
+                      0,            # next char index to enumerate
+                      [],           # password so far, as char codes
+                      0,            # code of the last (k-1) chars
+                      LVL,  # total level remaining
+                      lower_bound   # for password searching
+                      )
+
+
+def guess_number(pw, verbose=False):
+    """
+    Guess number of the password under the loaded model, or None if it is beyond
+    our index space (including passwords failing in_index_space() or with zero
+    probability).
+    """
+    global guess_count
+    if profile is not None:
+        profile.reset()
+
+    if cache is not None:
+        result = cache.guesses.get(pw, MISSING)
+        if result is not MISSING:
+            if profile is not None:
+                profile.report(event="guess", password=pw, guess_number=result, cached=True)
+            return result
+
+    LEN = len(pw)
+    components = None
+    if in_index_space(pw):
+        with profiling.phase(profile, "decompose"):
+            components = decompose_password(pw, levels.k)
+    if components is None:
+        if verbose:
+            print "Password is beyond our index space with {:n} passwords!\n".format(
+                index_space_size())
+        if profile is not None:
+            profile.report(event="guess", password=pw, length=LEN, guess_number=None,
+                           cached=False)
+        return None
+    LVL = sum(l for l, _, _ in components)
+    if verbose:
+        print("Password components: {}".format(components))
+        print("Password length: {}; Total level: {}".format(LEN, LVL))
+
+    # Skip over previous (length, level) cases
+    guess_count = 0
+    with profiling.phase(profile, "skip_prev_cases"):
+        found = skip_prev_cases(LEN, LVL)
+    if not found:
+        if verbose:
+            print "Password is beyond our index space with {:n} passwords!\n".format(guess_count)
+        result = None
+    else:
+        # Go through current (length, level) case
+        if verbose:
+            print "Skipped over {:n} passwords! :)\n".format(guess_count)
+        rank_in_bucket(pw, components, LVL, verbose)
+        result = guess_count
+
+    if cache is not None:
+        cache.guesses.put(pw, result)
+    if profile is not None:
+        profile.report(event="guess", password=pw, length=LEN, level=LVL, guess_number=result,
+                       cached=False)
+    return result
+
+
+def guess_numbers(passwords):
+    """
+    Guess numbers of many passwords under the loaded model, as a mapping from each
+    password to its guess number, or None if it is beyond our index space.
+
+    Passwords are grouped by (length, level) bucket and sorted by their components,
+    so that each bucket takes one pass over its checkpoints and one DFS per window
+    of checkpoints holding any of them, however many passwords it has.
+    """
+    global guess_count
+    if profile is not None:
+        profile.reset()
+
+    guess_count = 0
+
+    result = {}
+    buckets = {}
+    with profiling.phase(profile, "decompose"):
+        for pw in set(passwords):
+            if cache is not None:
+                cached = cache.guesses.get(pw, MISSING)
+                if cached is not MISSING:
+                    result[pw] = cached
+                    continue
+            components = decompose_password(pw, levels.k) if in_index_space(pw) else None
+            if components is None:
+                result[pw] = None
+                continue
+            LVL = sum(l for l, _, _ in components)
+            buckets.setdefault((len(pw), LVL), []).append((components, pw))
+
+    for (LEN, LVL), members in buckets.iteritems():
+        with profiling.phase(profile, "bucket_offset"):
+            offset = bucket_offset(LEN, LVL)
+        if offset is None:
+            for _, pw in members:
+                result[pw] = None
+            continue
+        members.sort()
+        for pw, count in rank_bucket(LEN, LVL, members).iteritems():
+            result[pw] = offset + count
+
+    if cache is not None:
+        for pw, guesses in result.iteritems():
+            cache.guesses.put(pw, guesses)
+    if profile is not None:
+        profile.report(event="batch", passwords=len(result), buckets=len(buckets))
+    return result
+
+
+def within_threshold(pw, threshold):
+    """
+    Whether the password gets guessed within threshold guesses, i.e. its guess number
+    is at most threshold. Bucket offsets and totals settle most queries; checkpoints
+    and the DFS are only used when threshold falls inside the password's own bucket.
+    Passwords failing in_index_space() or with zero probability are never within
+    threshold.
+    """
+    global guess_count
+    if profile is not None:
+        profile.reset()
+
+    if cache is not None:
+        result = cache.guesses.get(pw, MISSING)
+        if result is not MISSING:
+            result = result is not None and result <= threshold
+            if profile is not None:
+                profile.report(event="threshold", password=pw, threshold=threshold,
+                               result=result, settled_by="cache")
+            return result
+
+    LEN = len(pw)
+    components = None
+    if in_index_space(pw):
+        with profiling.phase(profile, "decompose"):
+            components = decompose_password(pw, levels.k)
+    if components is None:
+        if profile is not None:
+            profile.report(event="threshold", password=pw, length=LEN, threshold=threshold,
+                           result=False, settled_by="offset")
+        return False
+    LVL = sum(l for l, _, _ in components)
+
+    # Whole bucket before / after threshold
+    with profiling.phase(profile, "bucket_offset"):
+        offset = bucket_offset(LEN, LVL)
+        if offset is None or offset >= threshold:
+            result, settled_by = False, "offset"
+        elif offset + bucket_total(LEN, LVL) <= threshold:
+            result, settled_by = True, "offset"
+        else:
+            result = None
+
+    if result is None:
+        # Narrow down between checkpoints: pw comes no earlier than checkpoint idx - 1,
+        # and before checkpoint idx
+        with profiling.phase(profile, "read_checkpoint"):
+            current_cp = read_checkpoint(LEN, LVL)
+        with profiling.phase(profile, "binary_search"):
+            idx = max(0, binary_search(current_cp, components))
+        if offset + max(1, idx * CHECKPOINT_FREQUENCY) > threshold:
+            result, settled_by = False, "checkpoint"
+        elif idx < len(current_cp) and offset + (idx + 1) * CHECKPOINT_FREQUENCY - 1 <= threshold:
+            result, settled_by = True, "checkpoint"
+
+    if result is None:
+        guess_count = offset
+        rank_in_bucket(pw, components, LVL)
+        if cache is not None:
+            cache.guesses.put(pw, guess_count)
+        result, settled_by = guess_count <= threshold, "dfs"
+
+    if profile is not None:
+        profile.report(event="threshold", password=pw, length=LEN, level=LVL,
+                       threshold=threshold, result=result, settled_by=settled_by)
+    return result
+
+
 if __name__ == "__main__":
+    # Report counters and phase timers of each step to stderr
+    if "--profile" in sys.argv[1:]:
+        enable_profiling("-")
+    profiling.start_cprofile()
+
     # Clean screen
     tmp = os.system("clear")
 
@@ -311,48 +785,15 @@ if __name__ == "__main__":
     # Analyze password input
     pw = raw_input("Input password to guess -> " + color.UNDERLINE)
     print(color.END)
-    for c in pw:
-        if c not in ALPHABET:
-            print("Only alpha-numeric passwords are supported in this version!\n")
-            sys.exit(0)
+    if not is_supported(pw):
+        print("Only printable ASCII passwords are supported in this version!\n")
+        sys.exit(0)
     if len(pw) > MAX_LENGTH:
         print("Longest password supported is len = {}...\n".format(MAX_LENGTH))
         sys.exit(0)
 
-    LEN = len(pw)
-    components = decompose_password(pw, K)
-    print("Password components: {}".format(components))
-    LVL = sum(l for l, _, _ in components)
-    print("Password length: {}; Total level: {}".format(LEN, LVL))
-
-    # Skip over previous (length, level) cases
-    guess_count = 0
-    found = skip_prev_cases(LEN, LVL)
-    if not found:
-        print "Password is beyond our index space with {:n} passwords!\n".format(guess_count)
+    guess_count = guess_number(pw, verbose=True)
+    if guess_count is None:
         sys.exit(0)
-
-    # Go through current (length, level) case to find lower bound
-    print "Skipped over {:n} passwords! :)\n".format(guess_count)
-    with open(CHECKPOINT_PREFIX + "{}_{}.out".format(LEN, LVL)) as f:
-        current_cp = f.read().splitlines()[:-2]     # Entire file excluding last two summary lines
-    idx = binary_search(current_cp, components)
-    guess_count += max(0, idx) * CHECKPOINT_FREQUENCY
-    print("Using binary search to estimate guess count...")
-    print "Narrowed search between {:n} and {:n}".format(guess_count, guess_count + CHECKPOINT_FREQUENCY)
-
-    # Construct lower bound in DFS
-    if idx == 0 or len(current_cp) == 0:
-        lower_bound = None
-    else:
-        lower_bound = decompose_password(current_cp[idx - 1], K)
-
-    dfs_passwords(LEN,            # total length,
-                  K,            # k-gram model
-                  0,            # next char index to enumerate
-                  "",           # password so far
-                  LVL,  # total level remaining
-                  lower_bound   # for password searching
-                  )
     print(color.BOLD + color.UNDERLINE + color.YELLOW +
           "\nGuess Count: {:n}\n".format(guess_count) + color.END * 3)
@@ -0,0 +1,207 @@
+# Integer-coded level index shared by checkpoint.py and guess.py
+#
+# Input: Discrete probabilities in ../data/levels/*_*_*.json.
+#
+# Every level list keeps its on-disk order, with prefixes / chars replaced by
+# their codes (see alphabet.py) and the wildcard "" replaced by WILDCARD. On
+# top of that we keep reverse maps from code to (level, idx) for decomposition
+# and bitsets of the explicitly listed codes for wildcard expansion.
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import json                             # For JSON I/O
+import math                             # For log, round
+import os                               # For file stats
+import sys                              # For getsizeof
+
+from alphabet import ALPHABET_SIZE, encode, gram_code, new_bitset, bitset_add, bitset_has
+
+# Code of the wildcard ("") entry in a level list
+WILDCARD = -1
+
+
+def code_levels(levels, to_code):
+    """
+    Given a {level: [token]} mapping read from a level file, return the tuple
+    (levels, rank, wild) where levels is the same mapping over token codes,
+    rank maps each listed code to its (level, idx) and wild is the (level, idx)
+    of the wildcard entry (None if the model is not smoothed).
+    """
+    coded = {}
+    rank = {}
+    wild = None
+    for l, tokens in levels.iteritems():
+        l = int(l)
+        coded[l] = []
+        for idx, token in enumerate(tokens):
+            if token == "":
+                coded[l].append(WILDCARD)
+                wild = (l, idx)
+            else:
+                code = to_code(token)
+                coded[l].append(code)
+                rank[code] = (l, idx)
+    return coded, rank, wild
+
+
+def read_meta(prefix, k, smoothing):
+    """
+    Parameters of the (k, smoothing) model written by discretization.py along with
+    its level files, or None for level files built before it recorded any.
+    """
+    fname = prefix + "{}_{}_meta.json".format(k, smoothing)
+    if not os.path.exists(fname):
+        return None
+    with open(fname, 'r') as f:
+        return json.load(f)
+
+
+def model_params(prefix, k, smoothing, c1, c2, max_level):
+    """
+    Return (c1, c2, next_chr_lvl, max_level) of the (k, smoothing) model: scaling of
+    the mid probabilities and max level as recorded by discretization.py, falling
+    back to the given ones for level files built before it recorded any, and the
+    level of a char drawn from the wildcard entry under that scaling.
+    """
+    meta = read_meta(prefix, k, smoothing)
+    if meta is not None:
+        c1 = meta["scaling"]["mid"]["c1"]
+        c2 = meta["scaling"]["mid"]["c2"]
+        max_level = meta["max_level"]
+    next_chr_lvl = -int(round(math.log(c1 / ALPHABET_SIZE + c2)))
+    return c1, c2, next_chr_lvl, max_level
+
+
+class LevelIndex(object):
+    """
+    Level index of a (k, smoothing) model with all tokens integer-coded.
+    """
+
+    # Checkpoints held along with the index, if any (see shared_model.py)
+    checkpoints = None
+    # Bytes taken by the lists of mid_wildcards_cache, which fills up during the DFS
+    mid_wildcards_size = 0
+
+    def __init__(self, prefix, k, smoothing, next_chr_lvl):
+        self.k = k
+        self.smoothing = smoothing
+        self.next_chr_lvl = next_chr_lvl
+        # Number of distinct (k-1)-grams, and modulus to drop the first char of one
+        self.gram_space = ALPHABET_SIZE ** (k - 1)
+        self.shift_mod = ALPHABET_SIZE ** (k - 2)
+
+        # Identify the files we are built from, so that caches can tell models apart
+        self.version = (k, smoothing)
+        for t in ("start", "end", "mid"):
+            st = os.stat(prefix + "{}_{}_{}.json".format(k, smoothing, t))
+            self.version += ((int(st.st_mtime), st.st_size),)
+
+        to_gram = lambda token: gram_code(encode(token))
+        to_char = lambda token: encode(token)[0]
+
+        with open(prefix + "{}_{}_start.json".format(k, smoothing), 'r') as f:
+            self.start_lvl, self.start_rank, self.start_wild = code_levels(json.load(f), to_gram)
+        self.start_tokens = new_bitset(self.gram_space)     # Record all starting (k-1)-grams
+        for code in self.start_rank:
+            bitset_add(self.start_tokens, code)
+
+        with open(prefix + "{}_{}_end.json".format(k, smoothing), 'r') as f:
+            self.end_lvl, self.end_rank, self.end_wild = code_levels(json.load(f), to_gram)
+        self.end_tokens = new_bitset(self.gram_space)       # Record all ending (k-1)-grams
+        for code in self.end_rank:
+            bitset_add(self.end_tokens, code)
+
+        with open(prefix + "{}_{}_mid.json".format(k, smoothing), 'r') as f:
+            mid = json.load(f)
+        self.mid_lvl = {}
+        self.mid_rank = {}
+        self.mid_wild = {}
+        self.mid_tokens = {}    # Record chars after (k-1)-gram, as a bitmask over char codes
+        for prefix_str, levels in mid.iteritems():
+            code = to_gram(prefix_str)
+            self.mid_lvl[code], self.mid_rank[code], self.mid_wild[code] = code_levels(levels, to_char)
+            mask = 0
+            for c in self.mid_rank[code]:
+                mask |= 1 << c
+            self.mid_tokens[code] = mask
+        del(mid)
+
+        # Wildcard expansions of each prefix, built on first use
+        self.mid_wildcards_cache = {}
+
+    def next_prefix(self, prefix, c):
+        """
+        Code of the (k-1)-gram following prefix once char c is appended.
+        """
+        return (prefix % self.shift_mod) * ALPHABET_SIZE + c
+
+    def start_wildcards(self):
+        """
+        Generate, in enumeration order, the codes of all (k-1)-grams that are not
+        listed in the start index.
+        """
+        tokens = self.start_tokens
+        for code in xrange(self.gram_space):
+            if not (tokens[code >> 3] >> (code & 7)) & 1:
+                yield code
+
+    def mid_wildcards(self, prefix):
+        """
+        List, in enumeration order, the codes of all chars that are not listed
+        after the given prefix.
+        """
+        chars = self.mid_wildcards_cache.get(prefix)
+        if chars is None:
+            mask = self.mid_tokens[prefix]
+            chars = [c for c in xrange(ALPHABET_SIZE) if not (mask >> c) & 1]
+            self.mid_wildcards_cache[prefix] = chars
+            self.mid_wildcards_size += sys.getsizeof(chars)
+        return chars
+
+    def start_component(self, prefix):
+        """
+        The (level, idx, code) component of the starting (k-1)-gram prefix, or None
+        if it has zero probability (not listed, and the model is not smoothed).
+        """
+        if bitset_has(self.start_tokens, prefix):
+            l, index = self.start_rank[prefix]
+        elif self.start_wild is not None:   # Does not appear in index, must be wildcard
+            l, index = self.start_wild
+        else:
+            return None
+        return (l, index, prefix)
+
+    def next_component(self, prefix, c):
+        """
+        The (level, idx, code) component of char c following prefix, or None if it
+        has zero probability (not listed, and the model is not smoothed).
+        """
+        rank = self.mid_rank.get(prefix)
+        if rank is None:
+            # Prefix not in index -- all is wildcard case
+            return (self.next_chr_lvl, c, c)
+        elif c in rank:
+            l, index = rank[c]
+        elif self.mid_wild[prefix] is not None:
+            l, index = self.mid_wild[prefix]
+        else:
+            return None
+        return (l, index, c)
+
+    def decompose(self, codes):
+        """
+        Given a password as char codes, return a tuple of tuples of the form
+        (level, idx, code), one per prefix / next char, so that two passwords of
+        the same length and total level compare in their DFS order. None if the
+        model gives the password zero probability, i.e. it is never enumerated.
+        """
+        k = self.k
+        prefix = gram_code(codes[:k - 1])
+        result = [self.start_component(prefix)]
+        for i in xrange(k - 1, len(codes)):
+            result.append(self.next_component(prefix, codes[i]))
+            prefix = self.next_prefix(prefix, codes[i])
+        if None in result:
+            return None
+        return tuple(result)
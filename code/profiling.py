@@ -0,0 +1,145 @@
+# Hot-path counters and per-phase timers for checkpoint.py and guess.py
+#
+# Profiling is off unless turned on by the --profile flag of either script, by
+# enable_profiling() in guess.py, or by setting the environment variable
+# PG_PROFILE to where reports should go ("-" for stderr, or a file name that
+# JSON lines get appended to). While off, the hot paths only pay for an
+# `is not None` check per DFS node.
+#
+# Each report is a JSON object with the counters below, seconds spent in each
+# phase, and whatever the caller adds (password, bucket, guess number, ...):
+#   nodes       DFS calls
+#   pruned      DFS calls cut short by the level or lower bound checks
+#   wildcards   candidates generated by expanding a wildcard / unseen prefix
+#   leaves      passwords counted
+#   decompose   passwords decomposed into components
+#
+# Setting PG_CPROFILE to a file name additionally captures a cProfile of the
+# run there, viewable with `python -m pstats`.
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import json                             # For JSON output
+import os                               # For environment variables
+import sys                              # For stderr
+import time                             # For timing
+from collections import OrderedDict     # For ordered phases
+
+# Environment variables turning on reports and cProfile capture
+PROFILE_ENV = "PG_PROFILE"
+CPROFILE_ENV = "PG_CPROFILE"
+
+COUNTERS = ("nodes", "pruned", "wildcards", "leaves", "decompose")
+
+
+class Phase(object):
+    """
+    Context manager adding the time spent in it to a phase of the profile.
+    """
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc):
+        phases = self.profile.phases
+        phases[self.name] = phases.get(self.name, 0.0) + time.time() - self.start
+
+
+class NullPhase(object):
+    """
+    Context manager doing nothing, for when profiling is off.
+    """
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+NULL_PHASE = NullPhase()
+
+
+class Profile(object):
+    """
+    Counters and phase timers of one query / run, plus where to send reports.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self.last_report = None
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.pruned = 0
+        self.wildcards = 0
+        self.leaves = 0
+        self.decompose = 0
+        self.phases = OrderedDict()
+        self.start = time.time()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def report(self, **fields):
+        """
+        Build the report of the current query / run, send it to the log if any,
+        and start over.
+        """
+        report = OrderedDict(fields)
+        report["counters"] = OrderedDict((name, getattr(self, name)) for name in COUNTERS)
+        report["phases"] = self.phases
+        report["total"] = time.time() - self.start
+        self.last_report = report
+        if self.log is not None:
+            write_report(self.log, report)
+        self.reset()
+        return report
+
+
+def write_report(log, report):
+    line = json.dumps(report) + "\n"
+    if log == "-":
+        sys.stderr.write(line)
+    else:
+        with open(log, 'a') as f:
+            f.write(line)
+
+
+def from_environment():
+    """
+    Profile to use according to PG_PROFILE, or None if profiling is off.
+    """
+    log = os.environ.get(PROFILE_ENV)
+    return Profile(log) if log else None
+
+
+def phase(profile, name):
+    """
+    Time a phase of the given profile, which may be None.
+    """
+    return profile.phase(name) if profile is not None else NULL_PHASE
+
+
+def start_cprofile():
+    """
+    If PG_CPROFILE is set, capture a cProfile from now on, dumped there at exit.
+    """
+    path = os.environ.get(CPROFILE_ENV)
+    if not path:
+        return
+    import atexit
+    import cProfile
+    profiler = cProfile.Profile()
+    atexit.register(dump_cprofile, profiler, path)
+    profiler.enable()
+
+
+def dump_cprofile(profiler, path):
+    profiler.disable()
+    profiler.dump_stats(path)
@@ -0,0 +1,317 @@
+# Registry of models served side by side from one process
+#
+# guess.py scores passwords under the single model held in its globals (K,
+# SMOOTHING, c1 / c2, AVAILABLE_CP, level index, ...). A ModelRegistry keeps
+# those globals for any number of (k, smoothing) models and puts the right ones
+# in place around each scoring call, which names its model "${k}_${smoothing}":
+#   - Parameters come from ../data/levels/${k}_${smoothing}_meta.json written by
+#     discretization.py, and the available checkpoints from the files found in
+#     ../data/cps/${k}_${smoothing}/.
+#   - Level indexes are loaded on first use. Whenever the estimated memory of the
+#     loaded ones goes over the budget, the least recently used are evicted, save
+#     for those in use. A model counts for the private memory of its level index
+#     (not the mapping of a shared model file, which all processes share), plus the
+#     wildcard lists, bucket offsets and caches it builds up, re-estimated after
+#     each use.
+#
+# Limitations: models are swapped in and out of the module globals of guess.py
+# (MODEL_GLOBALS below), rather than handed to the scoring functions, as the whole
+# scoring path works off those globals. So:
+#   - All scoring through guess.py in the process, from any thread, is serialized
+#     on the registry lock while a model is active, even for different models.
+#   - Code calling guess.py directly must do so within activate(), or it scores
+#     under whatever model happens to be in place.
+#   - Only MODEL_GLOBALS are per model. They include the enumeration constants
+#     (CHECKPOINT_FREQUENCY, LVL_FACTOR, MAX_LENGTH), taken from guess.py when a
+#     model is first named; the profile and the per-call search state are shared.
+#
+# Usage:
+#   registry = ModelRegistry(memory_budget=1 << 30)
+#   registry.guess_number("3_additive", pw)
+#   registry.guess_number("4_additive", pw)
+#   with registry.activate("4_additive"):
+#       session.score()                 # Anything else working off guess.py
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import mmap                             # For shared mappings, not counted
+import os                               # For path expansion
+import re                               # For checkpoint file names
+import sys                              # For getsizeof
+import threading                        # For the registry lock
+import types                            # For objects not walked into
+from collections import OrderedDict     # For LRU order
+
+import guess                            # Model globals and scoring path
+from level_index import read_meta
+
+# Current directory of script
+CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
+# Input directory for level files
+LEVEL_PREFIX = os.path.join(CURRENT_DIR, "../data/levels/")
+# Input directory for checkpoint files
+CHECKPOINT_PREFIX = os.path.join(CURRENT_DIR, "../data/cps/")
+# Input directory for model files of shared_model.py
+SHARED_PREFIX = os.path.join(CURRENT_DIR, "../data/shared/")
+
+# Default memory budget of loaded level indexes, in bytes
+MEMORY_BUDGET = 2 << 30
+
+# Globals of guess.py that make up a model
+MODEL_GLOBALS = ("K", "SMOOTHING", "c1", "c2", "NEXT_CHR_LVL", "MAX_LEVEL", "AVAILABLE_CP",
+                 "CHECKPOINT_PREFIX", "CHECKPOINT_FREQUENCY", "LVL_FACTOR", "MAX_LENGTH",
+                 "levels", "bucket_offsets", "cache")
+
+CHECKPOINT_FILE = re.compile(r"^(\d+)_(\d+)\.out$")
+
+
+def available_checkpoints(path):
+    """
+    Levels with a checkpoint file in path for each length, in the form of AVAILABLE_CP.
+    Bucket offsets sum up every bucket before, so lengths must be contiguous and
+    levels of each length run from 0 without gaps; a missing file raises ValueError
+    rather than silently shifting the guess numbers of all later buckets.
+    """
+    found = {}
+    if os.path.isdir(path):
+        for fname in os.listdir(path):
+            match = CHECKPOINT_FILE.match(fname)
+            if match:
+                found.setdefault(int(match.group(1)), set()).add(int(match.group(2)))
+
+    available = {}
+    missing = []
+    if found:
+        for ln in xrange(min(found), max(found) + 1):
+            lvls = found.get(ln, set())
+            top = max(lvls) + 1 if lvls else 0
+            missing.extend("{}_{}.out".format(ln, lvl) for lvl in xrange(top) if lvl not in lvls)
+            if not lvls:
+                missing.append("{}_*.out".format(ln))
+            available[ln] = xrange(top)
+    if missing:
+        raise ValueError("Checkpoints missing in {}: {}".format(path, ", ".join(missing)))
+    return available
+
+
+def deep_size(root):
+    """
+    Estimated memory held by an object and everything it refers to, in bytes. Memory
+    mappings, which are shared between processes, are left out.
+    """
+    seen = set()
+    pending = [root]
+    size = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (mmap.mmap, type, types.FunctionType,
+                                               types.MethodType, types.ModuleType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending.extend(obj.iterkeys())
+            pending.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            pending.extend(vars(obj).itervalues())
+    return size
+
+
+def capture():
+    return dict((name, getattr(guess, name, None)) for name in MODEL_GLOBALS)
+
+
+def install(state):
+    for name in MODEL_GLOBALS:
+        setattr(guess, name, state[name])
+
+
+class Model(object):
+    """
+    One (k, smoothing) model: the values of the guess.py globals while it is in use,
+    and once loaded, the estimated memory of its level index.
+    """
+
+    def __init__(self, name, meta, checkpoint_prefix):
+        self.name = name
+        self.meta = meta
+        self.state = {"K": meta["k"],
+                      "SMOOTHING": meta["smoothing"],
+                      "c1": meta["scaling"]["mid"]["c1"],
+                      "c2": meta["scaling"]["mid"]["c2"],
+                      "NEXT_CHR_LVL": None,             # Set when loaded
+                      "MAX_LEVEL": meta["max_level"],
+                      "AVAILABLE_CP": available_checkpoints(checkpoint_prefix),
+                      "CHECKPOINT_PREFIX": checkpoint_prefix,
+                      "CHECKPOINT_FREQUENCY": guess.CHECKPOINT_FREQUENCY,
+                      "LVL_FACTOR": guess.LVL_FACTOR,
+                      "MAX_LENGTH": guess.MAX_LENGTH,
+                      "levels": None,
+                      "bucket_offsets": None,
+                      "cache": None,
+                      }
+        self.size = 0
+        self.index_size = 0         # Level index as loaded
+        self.offsets_size = 0       # Bucket offsets, once summed up
+        self.users = 0              # Activations in progress
+
+    @property
+    def loaded(self):
+        return self.state["levels"] is not None
+
+
+class Activation(object):
+    """
+    Context manager putting a model in place in guess.py, loading it first if
+    needed, and restoring the previous globals afterwards.
+    """
+
+    def __init__(self, registry, model):
+        self.registry = registry
+        self.model = model
+
+    def __enter__(self):
+        self.registry.lock.acquire()
+        self.saved = capture()
+        try:
+            self.model.users += 1
+            install(self.model.state)
+            if not self.model.loaded:
+                self.registry.load(self.model)
+            else:
+                self.registry.touch(self.model)
+        except:
+            self.model.users -= 1
+            install(self.saved)
+            self.registry.lock.release()
+            raise
+        return self.model
+
+    def __exit__(self, *exc):
+        # Keep what got built lazily, e.g. bucket offsets, and count it
+        self.model.state = capture()
+        self.model.users -= 1
+        install(self.saved)
+        try:
+            self.registry.measure(self.model)
+            self.registry.evict()
+        finally:
+            self.registry.lock.release()
+
+
+class ModelRegistry(object):
+    """
+    Models loaded on first use and evicted least recently used first once over the
+    memory budget. With shared=True, models are attached from the files written by
+    shared_model.py instead of loaded from the level files. With caching=True, each
+    model gets its own caches (see cache.py for the capacities that may be given).
+    """
+
+    def __init__(self, memory_budget=MEMORY_BUDGET, shared=False, caching=False, **capacities):
+        self.memory_budget = memory_budget
+        self.shared = shared
+        self.caching = caching
+        self.capacities = capacities
+        self.models = {}
+        self.loaded = OrderedDict()     # Least recently used first
+        self.lock = threading.RLock()
+
+    def names(self):
+        """
+        Names of the models with parameters from discretization.py.
+        """
+        suffix = "_meta.json"
+        return sorted(fname[:-len(suffix)] for fname in os.listdir(LEVEL_PREFIX)
+                      if fname.endswith(suffix))
+
+    def model(self, name):
+        with self.lock:
+            model = self.models.get(name)
+            if model is not None:
+                return model
+            try:
+                k, smoothing = name.split("_", 1)
+                meta = read_meta(LEVEL_PREFIX, int(k), smoothing)
+            except ValueError:
+                meta = None
+            if meta is None:
+                raise ValueError("Unknown model {}: run discretization.py to build it!".format(name))
+            model = Model(name, meta, CHECKPOINT_PREFIX + name + "/")
+            if not model.state["AVAILABLE_CP"]:
+                raise ValueError("No checkpoints for model {}: run checkpoint.py first!".format(name))
+            self.models[name] = model
+            return model
+
+    def activate(self, name):
+        """
+        Context manager for using the named model through guess.py directly.
+        """
+        return Activation(self, self.model(name))
+
+    def load(self, model):
+        """
+        Load the level index of a model put in place in guess.py.
+        """
+        if self.shared:
+            guess.attach_levels(SHARED_PREFIX + "{}.model".format(model.name))
+        else:
+            guess.load_levels(model.state["K"], model.state["SMOOTHING"])
+        if self.caching:
+            guess.enable_cache(**self.capacities)
+        model.index_size = deep_size(guess.levels)
+        model.state = capture()
+        self.measure(model)
+        self.loaded[model.name] = model
+        self.evict()
+
+    def measure(self, model):
+        """
+        Estimate the memory of a loaded model from its level index as loaded, and
+        what it has built up since.
+        """
+        state = model.state
+        if state["levels"] is None:
+            return
+        if not model.offsets_size and state["bucket_offsets"] is not None:
+            model.offsets_size = deep_size(state["bucket_offsets"])
+        model.size = model.index_size + state["levels"].mid_wildcards_size + model.offsets_size
+        if state["cache"] is not None:
+            model.size += state["cache"].memory()
+
+    def touch(self, model):
+        del self.loaded[model.name]
+        self.loaded[model.name] = model
+
+    def evict(self):
+        for model in self.loaded.values():
+            if self.memory_used() <= self.memory_budget:
+                break
+            if model.users:
+                continue
+            del self.loaded[model.name]
+            model.state.update(NEXT_CHR_LVL=None, levels=None, bucket_offsets=None, cache=None)
+            if guess.profile is not None:
+                guess.profile.report(event="evict", model=model.name, size=model.size)
+            model.size = model.index_size = model.offsets_size = 0
+
+    def memory_used(self):
+        return sum(model.size for model in self.loaded.itervalues())
+
+    def stats(self):
+        return dict((name, {"loaded": model.loaded, "size": model.size})
+                    for name, model in self.models.iteritems())
+
+    def guess_number(self, name, pw):
+        with self.activate(name):
+            return guess.guess_number(pw)
+
+    def guess_numbers(self, name, passwords):
+        with self.activate(name):
+            return guess.guess_numbers(passwords)
+
+    def within_threshold(self, name, pw, threshold):
+        with self.activate(name):
+            return guess.within_threshold(pw, threshold)
@@ -0,0 +1,153 @@
+# Incremental password scoring for strength meters
+#
+# A strength meter scores "p", "pa", "pas", ... on every keystroke. Instead of
+# decomposing each of them from scratch, a ScoringSession keeps one entry per
+# typed char with the component it adds (see decompose_password in guess.py),
+# the running total level and the code of the last (k-1) chars. Typing or
+# deleting a char thus costs a single component lookup.
+#
+# Bucket offsets come from bucket_offset() in guess.py, which sums them up once
+# per model, so that scoring is left with the checkpoint search and DFS within
+# the password's own bucket.
+#
+# Usage:
+#   guess.load_levels(guess.K, guess.SMOOTHING)
+#   session = ScoringSession()
+#   for pw in ("p", "pa", "pas"):
+#       session.update(pw)
+#       print(session.score())
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import guess                            # Model and scoring path
+from alphabet import CHAR_CODE, decode, gram_code, is_supported
+from cache import MISSING
+
+
+class ScoringSession(object):
+    """
+    Scores successive edits of one password under the model loaded in guess.py.
+    """
+
+    def __init__(self):
+        self.levels = guess.levels
+        self.codes = []
+        # One (component, total level, prefix code) per char; component and prefix
+        # code are None until the starting (k-1)-gram is complete, and component and
+        # level are None once the password has zero probability (unsmoothed models)
+        self.states = []
+
+    @property
+    def password(self):
+        return decode(self.codes)
+
+    @property
+    def level(self):
+        return self.states[-1][1] if self.states else 0
+
+    @property
+    def components(self):
+        """
+        Same as decompose_password() of the current password.
+        """
+        if self.level is None:
+            return None
+        return tuple(component for component, _, _ in self.states[self.levels.k - 2:])
+
+    def push(self, ch):
+        """
+        Append a char to the password. Raises ValueError, leaving the password as it
+        was, if the char is not supported.
+        """
+        c = CHAR_CODE.get(ch)
+        if c is None:
+            raise ValueError("Only printable ASCII passwords are supported in this version!")
+        self.codes.append(c)
+
+        k = self.levels.k
+        if len(self.codes) < k - 1:
+            self.states.append((None, 0, None))
+        elif len(self.codes) == k - 1:
+            prefix = gram_code(self.codes)
+            component = self.levels.start_component(prefix)
+            level = component[0] if component is not None else None
+            self.states.append((component, level, prefix))
+        else:
+            _, level, prefix = self.states[-1]
+            component = self.levels.next_component(prefix, c)
+            if level is not None and component is not None:
+                level += component[0]
+            else:
+                level = None
+            self.states.append((component, level, self.levels.next_prefix(prefix, c)))
+
+    def pop(self):
+        """
+        Delete the last char of the password.
+        """
+        self.codes.pop()
+        self.states.pop()
+
+    def update(self, pw):
+        """
+        Move to a new password, only redoing the chars after the part it has in
+        common with the current one. Raises ValueError, leaving the session as it
+        was, if the new password has any unsupported char.
+        """
+        common = 0
+        for a, b in zip(self.password, pw):
+            if a != b:
+                break
+            common += 1
+        if not is_supported(pw[common:]):
+            raise ValueError("Only printable ASCII passwords are supported in this version!")
+        while len(self.codes) > common:
+            self.pop()
+        for ch in pw[common:]:
+            self.push(ch)
+
+    def restart(self):
+        """
+        Redo the session under the model now loaded in guess.py.
+        """
+        pw = self.password
+        self.__init__()
+        self.update(pw)
+
+    def score(self):
+        """
+        Guess number of the current password, or None if it is beyond our index space.
+        """
+        profile = guess.profile
+        if profile is not None:
+            profile.reset()
+        if guess.levels is not self.levels:
+            self.restart()
+
+        pw = self.password
+        LEN = len(pw)
+        if LEN not in guess.AVAILABLE_CP:
+            return None
+        if guess.cache is not None:
+            result = guess.cache.guesses.get(pw, MISSING)
+            if result is not MISSING:
+                if profile is not None:
+                    profile.report(event="session", password=pw, guess_number=result, cached=True)
+                return result
+
+        LVL = self.level
+        offset = guess.bucket_offset(LEN, LVL) if LVL is not None else None
+        if offset is None:
+            result = None
+        else:
+            guess.guess_count = offset
+            guess.rank_in_bucket(pw, self.components, LVL)
+            result = guess.guess_count
+
+        if guess.cache is not None:
+            guess.cache.guesses.put(pw, result)
+        if profile is not None:
+            profile.report(event="session", password=pw, length=LEN, level=LVL, guess_number=result,
+                           cached=False)
+        return result
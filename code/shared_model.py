@@ -0,0 +1,445 @@
+# Flat, memory-mapped model for multi-process scoring
+#
+# Input: Level index (see level_index.py) and checkpoints of the model in guess.py.
+#
+# Output: A single model file, ../data/shared/${k}_${smoothing}.model, holding the
+#   level index and every checkpoint as flat little-endian arrays. Scoring
+#   processes map it read-only (see attach_levels in guess.py), so the OS keeps
+#   one copy of it in memory no matter how many workers attach.
+#
+# File layout:
+#   - MAGIC, then the length of the JSON metadata as a little-endian uint32;
+#   - JSON metadata: k, smoothing, next_chr_lvl, max_level, version, wildcard of
+#     the start index, mid_level_count (highest level of the mid index + 1)
+#     and {name: [offset, format, count]} for each array below;
+#   - the arrays, each starting at an 8-byte boundary:
+#       start_codes, start_levels       start index in (level, idx) order
+#       start_sorted, start_rank_lvl,   listed starting grams by code, with
+#       start_rank_idx                  their level and idx
+#       start_tokens                    bitset of listed starting grams
+#       prefix_tokens                   bitset of prefixes of the mid index
+#       prefix_blocks                   first prefix of each block (+ end), a block
+#                                       being the prefixes sharing their first k-2
+#                                       chars, i.e. the same code // ALPHABET_SIZE
+#       prefix_lasts                    last char of each prefix of the mid index,
+#                                       sorted within its block
+#       level_first                     for each prefix, first mid entry of each of
+#                                       its mid_level_count levels (+ end of prefix)
+#       wild_first                      first wildcard char of each prefix (+ end)
+#       wild_chars                      chars not listed after each prefix with a
+#                                       wildcard entry, in enumeration order
+#       prefix_wild_lvl, prefix_wild_idx   wildcard of each prefix (-1 if none)
+#       mid_chars                       mid entries in (level, idx) order
+#       buckets                         (len, level) of each checkpoint file
+#       bucket_totals, bucket_first     total passwords and first line of each
+#       line_starts                     offset of each checkpoint line (+ end)
+#       lines                           all checkpoint passwords, concatenated
+#
+# Everything the DFS needs of a prefix is laid out so that it is read straight off
+# the mapping: whether it is listed takes a byte of prefix_tokens, finding a listed
+# one a small block of prefix_lasts, and its chars at a level or its wildcard chars
+# a single range of mid_chars or wild_chars. Ranges are unpacked into short-lived
+# tuples (mmap has no buffer views in Python 2), and nothing decoded is kept, so
+# the memory of each worker stays flat however large the model, save for the start
+# index ranges and compiled struct formats (a few KB). The price is a few unpacks
+# per DFS node: scoring takes ~1.5x as long as with LevelIndex.
+#
+# For 08-731 F15
+# Authors: Derek Tzeng (dtzeng), Yiming Zong (yzong)
+
+import bisect                           # For lookups in sorted arrays
+import json                             # For metadata I/O
+import mmap                             # For read-only shared mapping
+import os                               # For path expansion
+import struct                           # For packing arrays
+
+from alphabet import ALPHABET_SIZE, new_bitset, bitset_add
+from level_index import LevelIndex
+
+# Current directory of script
+CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
+# Output directory for model files
+OUTPUT_PREFIX = os.path.join(CURRENT_DIR, "../data/shared/")
+
+# File signature
+MAGIC = "PGMODEL2"
+ALIGNMENT = 8
+
+
+
+class FlatArray(object):
+    """
+    Read-only view of a little-endian array in a buffer, read item by item.
+    """
+
+    def __init__(self, buf, offset, fmt, count):
+        self.buf = buf
+        self.offset = offset
+        self.fmt = "<" + fmt
+        self.item_fmt = fmt
+        self.itemsize = struct.calcsize(self.fmt)
+        self.count = count
+        # Compiled formats by number of items read at once
+        self.structs = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0 or i >= self.count:
+            raise IndexError(i)
+        return struct.unpack_from(self.fmt, self.buf, self.offset + i * self.itemsize)[0]
+
+    def items(self, lo, hi):
+        """
+        Tuple of items lo (inclusive) to hi (exclusive).
+        """
+        fmt = self.structs.get(hi - lo)
+        if fmt is None:
+            fmt = self.structs[hi - lo] = struct.Struct("<{}{}".format(hi - lo, self.item_fmt))
+        return fmt.unpack_from(self.buf, self.offset + lo * self.itemsize)
+
+    def find(self, value):
+        """
+        Position of value in a sorted array, or -1.
+        """
+        i = bisect.bisect_left(self, value)
+        if i < self.count and self[i] == value:
+            return i
+        return -1
+
+
+class StartLevels(object):
+    """
+    {level: [code]} view of the start index.
+    """
+
+    def __init__(self, codes, levels):
+        self.codes = codes
+        # level -> (first, last + 1) in codes
+        self.ranges = {}
+        all_levels = levels.items(0, len(levels))
+        for i, l in enumerate(all_levels):
+            first, _ = self.ranges.get(l, (i, i))
+            self.ranges[l] = (first, i + 1)
+
+    def __contains__(self, level):
+        return level in self.ranges
+
+    def __getitem__(self, level):
+        first, last = self.ranges[level]
+        return self.codes.items(first, last)
+
+
+class MidLevels(object):
+    """
+    {prefix: {level: [char]}} view of the mid index.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.get = index.prefix_levels     # Called on every DFS node
+
+    def __contains__(self, prefix):
+        return self.index.prefix_row(prefix) >= 0
+
+    def __getitem__(self, prefix):
+        table = self.get(prefix)
+        if table is None:
+            raise KeyError(prefix)
+        return table
+
+
+class PrefixLevels(object):
+    """
+    {level: [char]} view of the mid index entries of one prefix, given the first
+    entry of each of its levels (+ end).
+    """
+
+    __slots__ = ("chars", "firsts")
+
+    def __init__(self, chars, firsts):
+        self.chars = chars
+        self.firsts = firsts
+
+    def __contains__(self, level):
+        return 0 <= level < len(self.firsts) - 1 and self.firsts[level] < self.firsts[level + 1]
+
+    def __getitem__(self, level):
+        if level not in self:
+            raise KeyError(level)
+        return self.chars.items(self.firsts[level], self.firsts[level + 1])
+
+
+class Checkpoints(object):
+    """
+    Per-bucket totals and checkpoint passwords stored in the model file.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def bucket(self, LEN, LVL):
+        i = self.index.buckets.find(LEN * 65536 + LVL)
+        if i < 0:
+            raise IOError("No checkpoint for length {} and level {}".format(LEN, LVL))
+        return i
+
+    def total(self, LEN, LVL):
+        return self.index.bucket_totals[self.bucket(LEN, LVL)]
+
+    def passwords(self, LEN, LVL):
+        i = self.bucket(LEN, LVL)
+        first, last = self.index.bucket_first.items(i, i + 2)
+        return CheckpointLines(self.index, first, last)
+
+
+class CheckpointLines(object):
+    """
+    List-like view of the checkpoint passwords of one bucket.
+    """
+
+    def __init__(self, index, first, last):
+        self.index = index
+        self.first = first
+        self.count = last - first
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0 or i >= self.count:
+            raise IndexError(i)
+        start, end = self.index.line_starts.items(self.first + i, self.first + i + 2)
+        return self.index.buf[start:end]
+
+
+class SharedLevelIndex(LevelIndex):
+    """
+    Level index and checkpoints read from a model file mapped read-only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buf[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a model file".format(path))
+        meta_len = struct.unpack_from("<I", self.buf, len(MAGIC))[0]
+        meta_start = len(MAGIC) + 4
+        meta = json.loads(self.buf[meta_start:meta_start + meta_len])
+
+        self.k = meta["k"]
+        self.smoothing = meta["smoothing"]
+        self.next_chr_lvl = meta["next_chr_lvl"]
+        self.max_level = meta.get("max_level")     # None in files exported before
+        self.version = tuple(tuple(v) if isinstance(v, list) else v for v in meta["version"])
+        self.gram_space = ALPHABET_SIZE ** (self.k - 1)
+        self.shift_mod = ALPHABET_SIZE ** (self.k - 2)
+        self.start_wild = tuple(meta["start_wild"]) if meta["start_wild"] else None
+
+        for name, (offset, fmt, count) in meta["arrays"].iteritems():
+            setattr(self, name, FlatArray(self.buf, offset, fmt, count))
+        self.start_tokens_offset = meta["arrays"]["start_tokens"][0]
+        self.prefix_tokens_offset = meta["arrays"]["prefix_tokens"][0]
+
+        self.mid_level_count = meta["mid_level_count"]
+        self.start_lvl = StartLevels(self.start_codes, self.start_levels)
+        self.mid_lvl = MidLevels(self)
+        self.checkpoints = Checkpoints(self)
+
+    def has_prefix(self, prefix):
+        return prefix < self.gram_space and (
+            ord(self.buf[self.prefix_tokens_offset + (prefix >> 3)]) >> (prefix & 7)) & 1
+
+    def prefix_row(self, prefix):
+        """
+        Position of a prefix among those of the mid index, or -1 if not in it.
+        """
+        if not self.has_prefix(prefix):
+            return -1
+        block, c = divmod(prefix, ALPHABET_SIZE)
+        first, last = self.prefix_blocks.items(block, block + 2)
+        return first + bisect.bisect_left(self.prefix_lasts.items(first, last), c)
+
+    def prefix_levels(self, prefix, default=None):
+        """
+        {level: [char]} view of the mid index entries of a prefix, or default if
+        not in the index. Tests the bitset inline, as most prefixes met are not.
+        """
+        if prefix >= self.gram_space or not (
+                ord(self.buf[self.prefix_tokens_offset + (prefix >> 3)]) >> (prefix & 7)) & 1:
+            return default
+        return PrefixLevels(self.mid_chars, self.level_ranges(self.prefix_row(prefix)))
+
+    def level_ranges(self, i):
+        """
+        First mid entry of each level of the prefix at row i, followed by its end.
+        """
+        n = self.mid_level_count + 1
+        return self.level_first.items(i * n, (i + 1) * n)
+
+    def has_start_token(self, code):
+        return (ord(self.buf[self.start_tokens_offset + (code >> 3)]) >> (code & 7)) & 1
+
+    def start_wildcards(self):
+        for code in xrange(self.gram_space):
+            if not self.has_start_token(code):
+                yield code
+
+    def mid_wildcards(self, prefix):
+        i = self.prefix_row(prefix)
+        first, last = self.wild_first.items(i, i + 2)
+        return self.wild_chars.items(first, last)
+
+    def start_component(self, prefix):
+        if self.has_start_token(prefix):
+            i = self.start_sorted.find(prefix)
+            return (self.start_rank_lvl[i], self.start_rank_idx[i], prefix)
+        if self.start_wild is None:
+            return None
+        l, index = self.start_wild
+        return (l, index, prefix)
+
+    def next_component(self, prefix, c):
+        i = self.prefix_row(prefix)
+        if i < 0:
+            # Prefix not in index -- all is wildcard case
+            return (self.next_chr_lvl, c, c)
+        firsts = self.level_ranges(i)
+        chars = self.mid_chars.items(firsts[0], firsts[-1])
+        if c in chars:
+            pos = firsts[0] + chars.index(c)
+            l = bisect.bisect_right(firsts, pos) - 1
+            return (l, pos - firsts[l], c)
+        wild_lvl = self.prefix_wild_lvl[i]
+        if wild_lvl < 0:
+            return None
+        return (wild_lvl, self.prefix_wild_idx[i], c)
+
+
+def level_entries(lvl):
+    """
+    Flatten a {level: [code]} mapping into (levels, codes) in (level, idx) order.
+    """
+    levels, codes = [], []
+    for l in sorted(lvl):
+        levels.extend([l] * len(lvl[l]))
+        codes.extend(lvl[l])
+    return levels, codes
+
+
+def export_model(levels, max_level, checkpoint_prefix, buckets, path):
+    """
+    Write the level index of a model with the given max level and the checkpoints
+    of the given (length, level) buckets to a model file at path.
+    """
+    arrays = []     # (name, format, data)
+
+    start_levels, start_codes = level_entries(levels.start_lvl)
+    arrays.append(("start_codes", "q", start_codes))
+    arrays.append(("start_levels", "b", start_levels))
+    listed = sorted(levels.start_rank)
+    arrays.append(("start_sorted", "q", listed))
+    arrays.append(("start_rank_lvl", "b", [levels.start_rank[c][0] for c in listed]))
+    arrays.append(("start_rank_idx", "i", [levels.start_rank[c][1] for c in listed]))
+    arrays.append(("start_tokens", "B", levels.start_tokens))
+
+    prefixes = sorted(levels.mid_lvl)
+    mid_level_count = max([max(levels.mid_lvl[prefix]) for prefix in prefixes] or [-1]) + 1
+    blocks = (levels.gram_space - 1) // ALPHABET_SIZE + 1
+    prefix_blocks = [0] * (blocks + 1)
+    for prefix in prefixes:
+        prefix_blocks[prefix // ALPHABET_SIZE + 1] += 1
+    for b in xrange(blocks):
+        prefix_blocks[b + 1] += prefix_blocks[b]
+    level_first, wild_first, wild_chars, wild_lvl, wild_idx = [], [0], [], [], []
+    mid_chars = []
+    for prefix in prefixes:
+        table = levels.mid_lvl[prefix]
+        for l in xrange(mid_level_count):
+            level_first.append(len(mid_chars))
+            mid_chars.extend(table.get(l, ()))
+        level_first.append(len(mid_chars))
+        if levels.mid_wild[prefix] is not None:     # Only expanded if smoothed
+            wild_chars.extend(levels.mid_wildcards(prefix))
+        wild_first.append(len(wild_chars))
+        wild = levels.mid_wild[prefix] or (-1, -1)
+        wild_lvl.append(wild[0])
+        wild_idx.append(wild[1])
+    prefix_tokens = new_bitset(levels.gram_space)
+    for prefix in prefixes:
+        bitset_add(prefix_tokens, prefix)
+    arrays.append(("prefix_tokens", "B", prefix_tokens))
+    arrays.append(("prefix_blocks", "i", prefix_blocks))
+    arrays.append(("prefix_lasts", "B", [prefix % ALPHABET_SIZE for prefix in prefixes]))
+    arrays.append(("level_first", "i", level_first))
+    arrays.append(("wild_first", "i", wild_first))
+    arrays.append(("wild_chars", "B", wild_chars))
+    arrays.append(("prefix_wild_lvl", "b", wild_lvl))
+    arrays.append(("prefix_wild_idx", "i", wild_idx))
+    arrays.append(("mid_chars", "b", mid_chars))
+
+    # Checkpoint lines are only known once the arrays before them are laid out,
+    # so collect them first and patch line offsets at the end
+    bucket_keys, totals, bucket_first, lines = [], [], [0], []
+    for ln, lvl in sorted(buckets):
+        with open(checkpoint_prefix + "{}_{}.out".format(ln, lvl)) as f:
+            cp = f.read().splitlines()
+        bucket_keys.append(ln * 65536 + lvl)
+        totals.append(int(cp[-1]))
+        lines.extend(cp[:-2])   # Entire file excluding last two summary lines
+        bucket_first.append(len(lines))
+    arrays.append(("buckets", "q", bucket_keys))
+    arrays.append(("bucket_totals", "q", totals))
+    arrays.append(("bucket_first", "q", bucket_first))
+    arrays.append(("line_starts", "q", [0] * (len(lines) + 1)))
+
+    # Lay out arrays; metadata size depends on the offsets, so iterate until stable
+    meta = {"k": levels.k,
+            "smoothing": levels.smoothing,
+            "next_chr_lvl": levels.next_chr_lvl,
+            "max_level": max_level,
+            "version": levels.version,
+            "start_wild": levels.start_wild,
+            "mid_level_count": mid_level_count,
+            }
+    meta_len = 0
+    while True:
+        offset = len(MAGIC) + 4 + meta_len
+        meta["arrays"] = {}
+        for name, fmt, data in arrays:
+            offset += -offset % ALIGNMENT
+            meta["arrays"][name] = [offset, fmt, len(data)]
+            offset += struct.calcsize("<" + fmt) * len(data)
+        encoded = json.dumps(meta, sort_keys=True)
+        if len(encoded) == meta_len:
+            break
+        meta_len = len(encoded)
+    lines_start = offset
+    line_starts = arrays[-1][2]
+    for i, line in enumerate(lines):
+        line_starts[i + 1] = line_starts[i] + len(line)
+    for i in xrange(len(line_starts)):
+        line_starts[i] += lines_start
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", meta_len))
+        f.write(encoded)
+        for name, fmt, data in arrays:
+            offset, _, _ = meta["arrays"][name]
+            f.write("\0" * (offset - f.tell()))
+            f.write(struct.pack("<{}{}".format(len(data), fmt), *data))
+        f.write("".join(lines))
+
+
+if __name__ == "__main__":
+    import guess                        # Model parameters and checkpoints
+
+    OUTPUT_FILE = OUTPUT_PREFIX + "{}_{}.model".format(guess.K, guess.SMOOTHING)
+    print("Parameters of model: k={}, smoothing={}".format(guess.K, guess.SMOOTHING))
+    guess.load_levels(guess.K, guess.SMOOTHING)
+    print("Writing model file to {}...".format(OUTPUT_FILE))
+    export_model(guess.levels, guess.MAX_LEVEL, guess.CHECKPOINT_PREFIX, list(guess.bucket_order()), OUTPUT_FILE)
+    print("Done!")
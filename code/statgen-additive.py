@@ -15,18 +15,16 @@
 import json                             # For JSON I/O
 from collections import defaultdict     # For easier count mgmt
 import os                               # For path expansion
-import string                           # For string constants
 import itertools                        # For getting (k-1) grams
 
+from alphabet import ALPHABET, ALPHABET_SIZE
+
 # Current directory of script
 CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
 # Input password file
 PASSWD_FILE = os.path.join(CURRENT_DIR, "../data/input/dataset-ascii.csv")
 # Number of passwords between updating to stdout
 UPDATE_INTERVAL = 1500000
-# Valid chars in password
-ALPHABET = string.digits + string.ascii_letters + "~`!@#$%^&*()_-+={[}]|\:;\"'<,>.?/ "
-ALPHABET_SIZE = len(ALPHABET)
 
 # Smoothing constant
 SMOOTH_DELTA = 0.01